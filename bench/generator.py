@@ -0,0 +1,67 @@
+import random
+from typing import Optional
+
+OPERATORS = ("+", "-", "*")
+
+
+class ProgramGenerator:
+    """
+    Generates synthetic ezscript programs: `functions` integer functions with
+    `statements` assignments each, expressions nested `depth` parentheses deep and
+    at most `identifiers` distinct locals per function. Every function may call the
+    function generated before it once, so main's running time stays linear in the
+    program size.
+    """
+
+    def __init__(self, functions: int = 10, statements: int = 10, depth: int = 3, identifiers: int = 8,
+                 args: int = 2, seed: Optional[int] = 0):
+        self.functions = functions
+        self.statements = statements
+        self.depth = depth
+        self.identifiers = max(1, identifiers)
+        self.args = max(1, args)
+        self.random = random.Random(seed)
+
+    def params(self):
+        return {"functions": self.functions, "statements": self.statements, "depth": self.depth,
+                "identifiers": self.identifiers, "args": self.args}
+
+    def __term(self, names):
+        if self.random.random() < 0.3:
+            return str(self.random.randint(1, 9))
+        return self.random.choice(names)
+
+    def expression(self, names, depth, first=None):
+        expr = f"{self.__term(names)} {self.random.choice(OPERATORS)} {self.__term(names)}"
+        for i in range(depth):
+            left = first if first is not None and i == depth - 1 else self.__term(names)
+            expr = f"{left} {self.random.choice(OPERATORS)} ({expr})"
+        return expr
+
+    def function(self, index: int):
+        args = [f"x{i}" for i in range(self.args)]
+        lines = [f"fun f{index}({', '.join(f'{arg}: int' for arg in args)}): int"]
+        names = list(args)
+        target = args[0]
+        for i in range(self.statements):
+            target = f"v{i % self.identifiers}"
+            call = None
+            if i == 0 and index > 0:
+                call = f"f{index - 1}({', '.join(self.random.choice(names) for _ in range(self.args))})"
+            depth = self.depth if call is None else max(1, self.depth)
+            lines.append(f"    {target} = {self.expression(names, depth, call)}")
+            if target not in names:
+                names.append(target)
+        lines.append(f"    return {target}")
+        lines.append("end")
+        return "\n".join(lines)
+
+    def generate(self):
+        parts = [self.function(i) for i in range(self.functions)]
+        call = f"f{self.functions - 1}({', '.join('a' for _ in range(self.args))})" if self.functions else "a"
+        parts.append(f"fun main(): int\n    a = 1\n    r = {call}\n    return r\nend")
+        return "\n\n".join(parts) + "\n"
+
+
+def generate(functions: int = 10, statements: int = 10, depth: int = 3, identifiers: int = 8, seed: int = 0):
+    return ProgramGenerator(functions, statements, depth, identifiers, seed=seed).generate()
@@ -0,0 +1,81 @@
+import argparse
+import gc
+import sys
+import tracemalloc
+
+from bench.generator import ProgramGenerator
+from src import Lexer, Parser
+from src.ast import Value, Variable, FunctionCall, SetVariable, Return, ExpressionType, Types, walk
+
+NODES = {
+    "Value": lambda: Value(1, ExpressionType.VALUE),
+    "Variable": lambda: Variable("x", Types.INT),
+    "FunctionCall": lambda: FunctionCall("f", []),
+    "SetVariable": lambda: SetVariable("x", None),
+    "Return": lambda: Return(None),
+}
+
+
+class DictNode:
+    """
+    Stand-in with a per-instance __dict__, i.e. what every AST node used to be.
+    """
+
+
+def as_dict_node(node):
+    twin = DictNode()
+    for name in type(node).__slots__:
+        setattr(twin, name, getattr(node, name))
+    return twin
+
+
+def allocated(factory, count: int):
+    gc.collect()
+    tracemalloc.start()
+    nodes = [factory() for _ in range(count)]
+    size = tracemalloc.get_traced_memory()[0]
+    tracemalloc.stop()
+    del nodes
+    # The list holding the nodes is not part of the per node cost
+    return (size - sys.getsizeof([None] * count)) / count
+
+
+def per_node(count: int):
+    results = {}
+    for name, factory in NODES.items():
+        slotted = allocated(factory, count)
+        dict_based = allocated(lambda: as_dict_node(factory()), count)
+        results[name] = {"slots": slotted, "dict": dict_based}
+    return results
+
+
+def program(functions: int):
+    text = ProgramGenerator(functions, 10, 3, 8).generate()
+    gc.collect()
+    tracemalloc.start()
+    parser = Parser(Lexer(text))
+    parser.parse()
+    size = tracemalloc.get_traced_memory()[0]
+    tracemalloc.stop()
+    nodes = sum(1 for _ in walk(parser.getTree()))
+    return {"functions": functions, "nodes": nodes, "bytes": size, "bytes_per_node": size / nodes}
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(prog="bench.memory", description="Memory used per AST node")
+    parser.add_argument("--count", type=int, default=100000, help="instances allocated per node type")
+    parser.add_argument("--functions", type=int, default=200, help="functions in the parsed program")
+    args = parser.parse_args(argv)
+
+    print(f"{'node':>14} {'slots':>8} {'dict':>8} {'saved':>7}")
+    for name, sizes in per_node(args.count).items():
+        saved = 1 - sizes["slots"] / sizes["dict"]
+        print(f"{name:>14} {sizes['slots']:>7.0f}B {sizes['dict']:>7.0f}B {saved:>6.0%}")
+    result = program(args.functions)
+    print(f"\nparsed {result['functions']} functions: {result['nodes']} nodes, "
+          f"{result['bytes'] / 1024:.0f} KiB, {result['bytes_per_node']:.0f}B per node (including lexer and parser)")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,174 @@
+import argparse
+import json
+import platform
+import statistics
+import sys
+import time
+
+import llvmlite
+import llvmlite.binding as llvm
+
+from bench.generator import ProgramGenerator
+from src import Lexer, Parser, Token
+from src.compile import Compiler, JitSession, VERSION
+from src.compile.optimizer import optimize
+from src.instrument import instrumentation
+
+PHASES = ("lex", "parse", "fold", "types", "dead_code", "ir", "assemble", "jit")
+# Run by the Compiler constructor, they are timed through the instrumentation
+PASSES = ("fold", "types", "dead_code")
+
+
+class TokenReplay:
+    """
+    Stands in for a Lexer and replays recorded tokens, so parsing can be timed on its own.
+    """
+
+    def __init__(self, tokens, source_hash):
+        self.__tokens = tokens
+        self.__index = -1
+        self.__source_hash = source_hash
+
+    def nextToken(self):
+        self.__index += 1
+        if self.__index >= len(self.__tokens):
+            return Token.EOF
+        return self.__tokens[self.__index][0]
+
+    def lastIdentifier(self):
+        return self.__tokens[self.__index][1]
+
+    def lastPosition(self):
+        return 0, 0
+
+    def sourceHash(self):
+        return self.__source_hash
+
+
+def clock(f):
+    start = time.perf_counter()
+    result = f()
+    return time.perf_counter() - start, result
+
+
+def lex(text):
+    lexer = Lexer(text)
+    tokens = []
+    while (token := lexer.nextToken()) != Token.EOF:
+        tokens.append((token, lexer.lastIdentifier()))
+    return tokens
+
+
+def measure(text: str, opt_level: int = 0):
+    timings = {}
+    timings["lex"], tokens = clock(lambda: lex(text))
+    parser = Parser(TokenReplay(tokens, ""))
+    timings["parse"], _ = clock(parser.parse)
+    # The token stream is exhausted, so parsing again inside the compiler is a no-op
+    instrumentation.reset()
+    instrumentation.enable()
+    try:
+        compiler = Compiler("bench", parser, opt_level)
+    finally:
+        instrumentation.disable()
+    report = instrumentation.report()
+    for phase in PASSES:
+        timings[phase] = report[phase]["seconds"]
+    session = JitSession(opt_level)
+    timings["ir"], _ = clock(lambda: compiler.compile(session.target_data))
+    llvm_ir = str(compiler.module)
+
+    def assemble():
+        mod = llvm.parse_assembly(llvm_ir)
+        mod.verify()
+        optimize(mod, opt_level, session.target_machine)
+        return mod
+
+    timings["assemble"], mod = clock(assemble)
+    timings["jit"], _ = clock(lambda: session.add_module(mod))
+    counts = {"bytes": len(text), "tokens": len(tokens)}
+    return timings, counts
+
+
+def run(sizes, statements=10, depth=3, identifiers=8, opt_level=0, repeat=3, seed=0):
+    results = []
+    for size in sizes:
+        generator = ProgramGenerator(size, statements, depth, identifiers, seed=seed)
+        text = generator.generate()
+        samples = {phase: [] for phase in PHASES}
+        counts = {}
+        for _ in range(repeat):
+            timings, counts = measure(text, opt_level)
+            for phase in PHASES:
+                samples[phase].append(timings[phase])
+        results.append({
+            "params": {**generator.params(), "opt_level": opt_level},
+            **counts,
+            "phases": {phase: {"min": min(s), "median": statistics.median(s)} for phase, s in samples.items()},
+        })
+    return {
+        "meta": {"version": VERSION, "python": platform.python_version(), "llvmlite": llvmlite.__version__,
+                 "machine": platform.machine(), "cpu": llvm.get_host_cpu_name(), "repeat": repeat},
+        "results": results,
+    }
+
+
+def compare(report, baseline, threshold=0.25):
+    """
+    Phases whose best time got more than threshold (relative) slower than in baseline.
+    """
+    previous = {json.dumps(r["params"], sort_keys=True): r for r in baseline["results"]}
+    regressions = []
+    for result in report["results"]:
+        old = previous.get(json.dumps(result["params"], sort_keys=True))
+        if old is None:
+            continue
+        for phase, timing in result["phases"].items():
+            if phase not in old["phases"]:
+                continue
+            before, after = old["phases"][phase]["min"], timing["min"]
+            if before > 0 and after / before > 1 + threshold:
+                regressions.append({"params": result["params"], "phase": phase,
+                                    "baseline": before, "current": after, "ratio": after / before})
+    return regressions
+
+
+def print_report(report, out=sys.stdout):
+    print(f"{'functions':>10} {'tokens':>9} " + " ".join(f"{phase:>10}" for phase in PHASES), file=out)
+    for result in report["results"]:
+        times = " ".join(f"{result['phases'][phase]['min'] * 1000:>8.2f}ms" for phase in PHASES)
+        print(f"{result['params']['functions']:>10} {result['tokens']:>9} {times}", file=out)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(prog="bench.phases", description="Time every compiler phase on synthetic programs")
+    parser.add_argument("--sizes", default="10,100,1000", help="comma separated function counts")
+    parser.add_argument("--statements", type=int, default=10, help="statements per function")
+    parser.add_argument("--depth", type=int, default=3, help="expression nesting depth")
+    parser.add_argument("--identifiers", type=int, default=8, help="distinct locals per function")
+    parser.add_argument("-O", dest="opt_level", type=int, default=0, choices=range(4), help="optimization level")
+    parser.add_argument("--repeat", type=int, default=3, help="runs per size, the best one is compared")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("-o", "--output", help="write the results as JSON to this path")
+    parser.add_argument("--compare", help="baseline JSON to check the results against")
+    parser.add_argument("--threshold", type=float, default=0.25, help="allowed relative slowdown")
+    args = parser.parse_args(argv)
+
+    sizes = [int(size) for size in args.sizes.split(",")]
+    report = run(sizes, args.statements, args.depth, args.identifiers, args.opt_level, args.repeat, args.seed)
+    print_report(report)
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(report, f, indent=2)
+    if args.compare:
+        with open(args.compare) as f:
+            regressions = compare(report, json.load(f), args.threshold)
+        for r in regressions:
+            print(f"REGRESSION {r['phase']} at {r['params']['functions']} functions: "
+                  f"{r['baseline'] * 1000:.2f}ms -> {r['current'] * 1000:.2f}ms ({r['ratio']:.2f}x)")
+        return 1 if regressions else 0
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
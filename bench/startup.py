@@ -0,0 +1,102 @@
+import argparse
+import json
+import os
+import platform
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+
+from bench.generator import generate
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+COMMANDS = {
+    "check": ["check", "{source}"],
+    "ast": ["ast", "{source}"],
+    "ir": ["ir", "{source}"],
+    "run": ["run", "{source}"],
+    "run --interpret": ["run", "--interpret", "{source}"],
+    "build": ["build", "-j", "1", "-o", "{output}", "{source}"],
+}
+
+
+def first_result(argv):
+    """
+    Seconds from starting `python -m src argv` to the first byte of its output and to its exit.
+    """
+    start = time.perf_counter()
+    process = subprocess.Popen([sys.executable, "-m", "src", *argv], cwd=ROOT, stdout=subprocess.PIPE,
+                               stderr=subprocess.PIPE)
+    process.stdout.read(1)
+    first = time.perf_counter() - start
+    _, err = process.communicate()
+    total = time.perf_counter() - start
+    if process.returncode != 0:
+        raise Exception(f"ezscript {' '.join(argv)} failed: {err.decode().strip()}")
+    return first, total
+
+
+def imports(argv):
+    """
+    Seconds spent importing modules for argv, measured with -X importtime, and whether llvmlite was one of them.
+    """
+    process = subprocess.run([sys.executable, "-X", "importtime", "-m", "src", *argv], cwd=ROOT,
+                             capture_output=True, text=True, check=True)
+    seconds = 0
+    llvm = False
+    for line in process.stderr.splitlines():
+        if not line.startswith("import time:") or "self [us]" in line:
+            continue
+        own, _, name = (part.strip() for part in line[len("import time:"):].split("|"))
+        seconds += int(own) / 1e6
+        llvm = llvm or name.split(".")[0] == "llvmlite"
+    return seconds, llvm
+
+
+def run(functions=100, repeat=5, seed=0):
+    results = {}
+    with tempfile.TemporaryDirectory() as directory:
+        source = os.path.join(directory, "startup.ez")
+        with open(source, "w") as f:
+            f.write(generate(functions, seed=seed))
+        for name, template in COMMANDS.items():
+            argv = [arg.format(source=source, output=os.path.join(directory, "startup.bc")) for arg in template]
+            samples = [first_result(argv) for _ in range(repeat)]
+            seconds, llvm = imports(argv)
+            results[name] = {"first_result": {"min": min(s[0] for s in samples),
+                                              "median": statistics.median(s[0] for s in samples)},
+                             "exit": {"min": min(s[1] for s in samples),
+                                      "median": statistics.median(s[1] for s in samples)},
+                             "imports": seconds, "llvmlite": llvm}
+    return {"meta": {"python": platform.python_version(), "machine": platform.machine(), "functions": functions,
+                     "repeat": repeat},
+            "results": results}
+
+
+def print_report(report, out=sys.stdout):
+    print(f"{'command':>16} {'imports':>10} {'first':>10} {'exit':>10} {'llvmlite':>9}", file=out)
+    for name, result in report["results"].items():
+        print(f"{name:>16} {result['imports'] * 1000:>8.1f}ms {result['first_result']['min'] * 1000:>8.1f}ms "
+              f"{result['exit']['min'] * 1000:>8.1f}ms {'yes' if result['llvmlite'] else 'no':>9}", file=out)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(prog="bench.startup",
+                                     description="Import time and first result latency of every ezscript command")
+    parser.add_argument("--functions", type=int, default=100, help="functions in the generated program")
+    parser.add_argument("--repeat", type=int, default=5, help="runs per command, the best one is reported")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("-o", "--output", help="write the results as JSON to this path")
+    args = parser.parse_args(argv)
+
+    report = run(args.functions, args.repeat, args.seed)
+    print_report(report)
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(report, f, indent=2)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
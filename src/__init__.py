@@ -1,4 +1,5 @@
 from .lexer import Lexer
 from .token import Token
 from .peak_stack import PeakStack
+from .symbol_table import SymbolTable
 from .parser import Parser
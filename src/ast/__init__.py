@@ -6,3 +6,4 @@ from .value import Value, ExpressionType
 from .function_call import FunctionCall
 from .ret import Return
 from .set_variable import SetVariable
+from .walk import walk, children, calls, count
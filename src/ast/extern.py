@@ -1,4 +1,6 @@
 class Extern():
+    __slots__ = ("identifier", "function")
+
     def __init__(self, identifier, function):
         self.identifier = identifier
         self.function = function
@@ -2,6 +2,8 @@ from .scope import Scope
 
 
 class Function(Scope):
+    __slots__ = ("name", "args", "ret")
+
     def __init__(self, name, args=None, ret=None):
         super().__init__()
         if args is None:
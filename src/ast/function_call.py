@@ -1,4 +1,6 @@
 class FunctionCall:
+    __slots__ = ("name", "args")
+
     def __init__(self, name, args=None):
         self.name = name
         self.args = args
@@ -1,3 +1,6 @@
 class Return:
+    __slots__ = ("value", "value_type")
+
     def __init__(self, value):
         self.value = value
+        self.value_type = None
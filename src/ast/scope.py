@@ -5,8 +5,21 @@ import src.ast as ast
 
 
 class Scope:
+    __slots__ = ("commands", "variables", "functions", "root", "symbols")
+
     def __init__(self, root=False):
         self.commands = []
         self.variables: List[Variable] = []
         self.functions: List[ast.Function] = []
         self.root = root
+        self.symbols = None
+
+    def add_variable(self, variable: Variable):
+        self.variables.append(variable)
+        if self.symbols is not None:
+            self.symbols.add_variable(variable, self)
+
+    def add_function(self, function: 'ast.Function'):
+        self.functions.append(function)
+        if self.symbols is not None:
+            self.symbols.add_function(function, self)
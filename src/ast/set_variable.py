@@ -1,5 +1,8 @@
 class SetVariable:
+    __slots__ = ("name", "value", "deref", "value_type")
+
     def __init__(self, name, value, deref=False):
         self.name = name
         self.value = value
         self.deref = deref
+        self.value_type = None
@@ -10,11 +10,15 @@ class ExpressionType(Enum):
     REFERENCE = -6
     DEREFERENCE = -7
     PLACEHOLDER = -8
+    NEGATE = -9
 
 
 class Value:
+    __slots__ = ("type", "right", "left", "value", "value_type")
+
     def __init__(self, value, te: ExpressionType):
         self.type = te
         self.right = None
         self.left = None
         self.value = value
+        self.value_type = None
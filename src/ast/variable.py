@@ -28,6 +28,9 @@ class Types(Enum):
 
 
 class Variable:
-    def __init__(self, name, types: Types):
+    __slots__ = ("name", "type", "pointee")
+
+    def __init__(self, name, types: Types, pointee: Types = None):
         self.name = name
         self.type = types
+        self.pointee = pointee
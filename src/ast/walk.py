@@ -0,0 +1,47 @@
+from .function import Function
+from .function_call import FunctionCall
+from .ret import Return
+from .scope import Scope
+from .set_variable import SetVariable
+from .value import Value
+from .variable import Variable
+
+
+def children(node):
+    if isinstance(node, Value):
+        kids = []
+        if isinstance(node.value, (FunctionCall, Variable)):
+            kids.append(node.value)
+        if node.left is not None:
+            kids.append(node.left)
+        if node.right is not None:
+            kids.append(node.right)
+        return kids
+    elif isinstance(node, FunctionCall):
+        return node.args or []
+    elif isinstance(node, (SetVariable, Return)):
+        return [node.value]
+    elif isinstance(node, Function):
+        return node.args + node.functions + node.commands
+    elif isinstance(node, Scope):
+        return node.functions + node.commands
+    return []
+
+
+def walk(node):
+    """
+    Every node below and including node in pre-order, without recursing in Python.
+    """
+    stack = [node]
+    while stack:
+        node = stack.pop()
+        yield node
+        stack.extend(reversed(children(node)))
+
+
+def count(node):
+    return sum(1 for _ in walk(node))
+
+
+def calls(node):
+    return [n.name for n in walk(node) if isinstance(n, FunctionCall)]
@@ -0,0 +1,215 @@
+"""
+The ezscript command line. check and ast only run the front end, llvmlite is
+imported inside the commands that generate code so they never pay for it.
+"""
+import argparse
+import os
+import sys
+
+from src.ast import Extern, ExpressionType, Function, FunctionCall, Return, Scope, SetVariable, Types, Variable
+from src.ast.walk import children
+from src.importer import FileImporter
+from src.instrument import instrumentation
+from src.lexer import Lexer
+from src.parser import Parser
+from src.passes import fold_constants, resolve_types, eliminate_dead_code
+
+TYPE_NAMES = {Types.INT: "int", Types.FLOAT: "double", Types.BOOL: "bool", Types.POINTER: "pointer", None: "?"}
+
+
+def module_name(path: str):
+    return os.path.splitext(os.path.basename(path))[0]
+
+
+def open_parser(path: str, search_path=()):
+    return Parser(Lexer.open(path), FileImporter(os.path.dirname(os.path.abspath(path)), search_path))
+
+
+def run_passes(root: Scope):
+    with instrumentation.phase("fold"):
+        fold_constants(root)
+    with instrumentation.phase("types"):
+        resolve_types(root)
+    with instrumentation.phase("dead_code"):
+        eliminate_dead_code(root)
+
+
+def signature(func: Function):
+    args = ", ".join(f"{arg.name}: {TYPE_NAMES[arg.type]}" for arg in func.args)
+    return f"{func.name}({args}): {TYPE_NAMES[func.ret]}"
+
+
+def describe(node):
+    if isinstance(node, Function):
+        return f"Function {signature(node)}"
+    elif isinstance(node, Scope):
+        return "Scope"
+    elif isinstance(node, Extern):
+        return f"Extern {signature(node.function)}"
+    elif isinstance(node, Variable):
+        return f"Variable {node.name}: {TYPE_NAMES[node.type]}"
+    elif isinstance(node, FunctionCall):
+        return f"Call {node.name}"
+    elif isinstance(node, SetVariable):
+        label = f"Set {'*' if node.deref else ''}{node.name}"
+    elif isinstance(node, Return):
+        label = "Return"
+    elif node.type == ExpressionType.VALUE and not isinstance(node.value, (FunctionCall, Variable)):
+        label = f"Value {node.value!r}"
+    else:
+        label = node.type.name.capitalize()
+    # Only known once the type pass ran
+    return label if node.value_type is None else f"{label} : {TYPE_NAMES[node.value_type]}"
+
+
+def dump_tree(root: Scope, out=None):
+    out = sys.stdout if out is None else out
+    stack = [(root, 0)]
+    while stack:
+        node, depth = stack.pop()
+        print("  " * depth + describe(node), file=out)
+        stack.extend((child, depth + 1) for child in reversed(children(node)))
+
+
+def check(args):
+    status = 0
+    for path in args.sources:
+        try:
+            parser = open_parser(path, args.search_path)
+            parser.parse()
+            run_passes(parser.getTree())
+        except Exception as e:
+            print(f"{path}: {str(e) or 'syntax error'}", file=sys.stderr)
+            status = 1
+        else:
+            print(f"{path}: ok")
+    return status
+
+
+def ast(args):
+    parser = open_parser(args.source, args.search_path)
+    parser.parse()
+    if args.passes:
+        run_passes(parser.getTree())
+    dump_tree(parser.getTree())
+    return 0
+
+
+def ir(args):
+    import llvmlite.binding as llvm
+    from src.compile.compiler import Compiler
+    from src.compile.optimizer import create_target_machine, optimize
+    from src.compile.session import initialize
+
+    initialize()
+    target_machine = create_target_machine(args.opt_level)
+    compiler = Compiler(module_name(args.source), open_parser(args.source, args.search_path), args.opt_level)
+    compiler.compile(target_machine.target_data)
+    if args.opt_level == 0:
+        print(compiler.module)
+        return 0
+    mod = llvm.parse_assembly(str(compiler.module))
+    mod.triple = target_machine.triple
+    mod.data_layout = str(target_machine.target_data)
+    mod.verify()
+    optimize(mod, args.opt_level, target_machine)
+    print(mod)
+    return 0
+
+
+def run(args):
+    if args.interpret:
+        from src.interpreter import Interpreter
+        interpreter = Interpreter(module_name(args.source), open_parser(args.source, args.search_path),
+                                  args.threshold, args.opt_level)
+        print(interpreter.run())
+        return 0
+
+    from src.compile.session import JitSession
+    if args.source.endswith(".ezbc"):
+        from src.compile.artifact import Artifact
+        session = JitSession(args.opt_level, libraries=args.libraries)
+        Artifact.read(args.source).load_into(session)
+        print(session.function("main")())
+        return 0
+
+    from src.compile.build import build, discover
+    if len(discover([args.source], args.search_path)) > 1:
+        # Imported files are only resolved by linking, which the build driver does
+        result = build([args.source], args.opt_level, 1, args.search_path)
+        session = JitSession(args.opt_level, libraries=args.libraries)
+        session.add_module(result.module, result.signatures)
+        print(session.function("main")())
+        return 0
+
+    from src.compile.cache import ObjectCache
+    from src.compile.compiler import Compiler
+    from src.compile.runner import run as run_compiled
+    compiler = Compiler(module_name(args.source), open_parser(args.source, args.search_path), args.opt_level)
+    cache = None if args.cache is None else ObjectCache(args.cache)
+    run_compiled(compiler, cache=cache, dump_ir=args.dump_ir, libraries=args.libraries, lazy=args.lazy)
+    return 0
+
+
+def build(argv):
+    from src.compile.build import main as build_main
+    return build_main(argv, prog="ezscript build")
+
+
+def print_timings(out=None):
+    out = sys.stderr if out is None else out
+    for name, entry in instrumentation.report().items():
+        counters = " ".join(f"{counter}={value}" for counter, value in entry["counters"].items())
+        print(f"{name:>10} {entry['seconds'] * 1000:>9.3f}ms {counters}", file=out)
+
+
+def main(argv=None):
+    argv = sys.argv[1:] if argv is None else list(argv)
+    parser = argparse.ArgumentParser(prog="ezscript", description="Check, inspect, run and build ezscript programs")
+    parser.add_argument("--timings", action="store_true", help="print the time spent in every phase to stderr")
+    commands = parser.add_subparsers(dest="command", required=True)
+
+    def command(name, handler, help):
+        sub = commands.add_parser(name, help=help)
+        sub.add_argument("-I", dest="search_path", action="append", default=[], help="import search directory")
+        sub.set_defaults(handler=handler)
+        return sub
+
+    sub = command("check", check, "parse and type check without generating code")
+    sub.add_argument("sources", nargs="+", help=".ez source files")
+    sub = command("ast", ast, "print the syntax tree")
+    sub.add_argument("source", help=".ez source file")
+    sub.add_argument("--passes", action="store_true", help="fold, type and prune the tree first")
+    sub = command("ir", ir, "print the LLVM IR")
+    sub.add_argument("source", help=".ez source file")
+    sub.add_argument("-O", dest="opt_level", type=int, default=0, choices=range(4), help="optimization level")
+    sub = command("run", run, "run main and print its result")
+    sub.add_argument("source", help=".ez source file or .ezbc artifact")
+    sub.add_argument("-O", dest="opt_level", type=int, default=0, choices=range(4), help="optimization level")
+    sub.add_argument("-l", dest="libraries", action="append", default=[], help="shared library to bind externs to")
+    sub.add_argument("--cache", help="object cache directory")
+    sub.add_argument("--dump-ir", help="write the IR before and after optimization to this directory")
+    sub.add_argument("--lazy", action="store_true", help="compile functions on their first call")
+    sub.add_argument("--interpret", action="store_true", help="walk the tree, compiling only hot functions")
+    sub.add_argument("--threshold", type=int, default=1000, help="calls before --interpret compiles a function")
+    # Everything after build goes to ezscript-build unchanged, its own -h included
+    commands.add_parser("build", help="build a multi-file program, see ezscript build -h", add_help=False)
+
+    index = next((i for i, arg in enumerate(argv) if not arg.startswith("-")), len(argv))
+    if index < len(argv) and argv[index] == "build":
+        args = parser.parse_args(argv[:index] + ["build"])
+        handler, rest = build, argv[index + 1:]
+    else:
+        args = parser.parse_args(argv)
+        handler, rest = args.handler, args
+
+    if args.timings:
+        instrumentation.enable()
+    try:
+        return handler(rest)
+    except Exception as e:
+        print(f"ezscript: {str(e) or 'syntax error'}", file=sys.stderr)
+        return 1
+    finally:
+        if args.timings:
+            print_timings()
@@ -0,0 +1,90 @@
+"""
+The client side of the compile server in src/server.py. It only needs the standard
+library, so scripts using it start without importing llvmlite.
+
+Clients talk to the server over a Unix domain socket. Every message in either
+direction is a frame: a 4 byte big endian length followed by that many bytes of
+UTF-8 JSON.
+Requests carry an "op" and an optional "id" that is echoed back:
+
+    {"op": "compile", "source": ..., "name": ..., "opt_level": 0}
+        -> {"module": key, "functions": [{"name", "args", "ret"}, ...]}
+    {"op": "run", "source" or "module": ..., "function": "main", "args": [...]}
+        -> {"module": key, "result": value}
+    {"op": "call", "module": key, "function": ..., "args": [...]}
+    {"op": "call", "module": key, "function": ..., "calls": [[...], ...]}
+        -> {"result": value} or {"results": [value, ...]}
+    {"op": "stats"}, {"op": "ping"}, {"op": "shutdown"}
+
+Every response has "ok", failed requests have "ok": false and an "error" message.
+"""
+import json
+import socket
+import struct
+from typing import Optional
+
+HEADER = struct.Struct(">I")
+MAX_FRAME = 64 * 1024 * 1024
+
+
+def encode(message: dict):
+    data = json.dumps(message).encode("utf-8")
+    return HEADER.pack(len(data)) + data
+
+
+class Client:
+    """
+    Blocking client for CompileServer, one request at a time over one connection.
+    """
+
+    def __init__(self, path: str, timeout: Optional[float] = None):
+        self.__socket = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        self.__socket.settimeout(timeout)
+        self.__socket.connect(path)
+        self.__next_id = 0
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    def close(self):
+        self.__socket.close()
+
+    def __receive(self, size: int):
+        data = bytearray()
+        while len(data) < size:
+            chunk = self.__socket.recv(size - len(data))
+            if not chunk:
+                raise Exception("The compile server closed the connection")
+            data += chunk
+        return bytes(data)
+
+    def request(self, op: str, **fields):
+        self.__next_id += 1
+        self.__socket.sendall(encode(dict(fields, op=op, id=self.__next_id)))
+        length, = HEADER.unpack(self.__receive(HEADER.size))
+        response = json.loads(self.__receive(length))
+        if not response.get("ok"):
+            raise Exception(response.get("error"))
+        return response
+
+    def compile(self, source: str, name: Optional[str] = None, opt_level: int = 0):
+        return self.request("compile", source=source, name=name, opt_level=opt_level)["module"]
+
+    def run(self, source: str, function: str = "main", args=(), opt_level: int = 0):
+        return self.request("run", source=source, function=function, args=list(args), opt_level=opt_level)["result"]
+
+    def call(self, module: str, function: str, *args):
+        return self.request("call", module=module, function=function, args=list(args))["result"]
+
+    def call_many(self, module: str, function: str, calls):
+        return self.request("call", module=module, function=function, calls=[list(c) for c in calls])["results"]
+
+    def stats(self):
+        response = self.request("stats")
+        return {k: response[k] for k in ("modules", "requests", "hits", "misses")}
+
+    def shutdown(self):
+        self.request("shutdown")
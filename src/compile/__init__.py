@@ -1 +1,19 @@
-from .compiler import Compiler
\ No newline at end of file
+import importlib
+
+# Importing the package must not load llvmlite, so these are only imported on first access
+_EXPORTS = {
+    "Compiler": "compiler",
+    "VERSION": "compiler",
+    "ObjectCache": "cache",
+    "JitSession": "session",
+}
+
+__all__ = list(_EXPORTS)
+
+
+def __getattr__(name):
+    if name not in _EXPORTS:
+        raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
+    value = getattr(importlib.import_module(f"{__name__}.{_EXPORTS[name]}"), name)
+    globals()[name] = value
+    return value
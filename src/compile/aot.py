@@ -0,0 +1,126 @@
+import argparse
+import ctypes
+import os
+import subprocess
+import sys
+from typing import List, Optional
+
+import llvmlite.binding as llvm
+
+from src import Lexer, Parser
+from src.ast import Extern, Types
+from src.compile.compiler import Compiler
+from src.compile.optimizer import create_target_machine, optimize
+from src.compile.session import initialize
+from src.instrument import instrumentation
+
+EMIT_KINDS = ("obj", "asm", "so")
+C_TYPES = {Types.INT: "int32_t", Types.FLOAT: "double", Types.BOOL: "bool", Types.POINTER: "void *", None: "int32_t"}
+
+
+def compile_module(compiler: Compiler, opt_level: Optional[int] = None, cpu: Optional[str] = None):
+    """
+    Lower compiler to an optimized llvmlite.binding module for position independent
+    native code. Returns the module and the target machine to emit it with.
+    """
+    initialize()
+    opt_level = compiler.opt_level if opt_level is None else opt_level
+    target_machine = create_target_machine(opt_level, reloc="pic", codemodel="default", cpu=cpu)
+    compiler.compile(target_machine.target_data)
+    with instrumentation.phase("assemble"):
+        mod = llvm.parse_assembly(str(compiler.module))
+        mod.triple = target_machine.triple
+        mod.data_layout = str(target_machine.target_data)
+        mod.verify()
+    with instrumentation.phase("optimize"):
+        optimize(mod, opt_level, target_machine)
+    return mod, target_machine
+
+
+def emit_object(compiler: Compiler, path: str, opt_level: Optional[int] = None, cpu: Optional[str] = None):
+    mod, target_machine = compile_module(compiler, opt_level, cpu)
+    with instrumentation.phase("emit") as phase:
+        obj = target_machine.emit_object(mod)
+        if phase:
+            phase.counters["code_bytes"] = len(obj)
+    with open(path, "wb") as f:
+        f.write(obj)
+    return path
+
+
+def emit_assembly(compiler: Compiler, path: str, opt_level: Optional[int] = None, cpu: Optional[str] = None):
+    mod, target_machine = compile_module(compiler, opt_level, cpu)
+    with open(path, "w") as f:
+        f.write(target_machine.emit_assembly(mod))
+    return path
+
+
+def link_shared(objects: List[str], output: str, libraries: List[str] = (), linker: Optional[str] = None):
+    linker = linker or os.environ.get("CC", "cc")
+    command = [linker, "-shared", "-o", output, *objects, *[f"-l{lib}" for lib in libraries]]
+    result = subprocess.run(command, capture_output=True, text=True)
+    if result.returncode != 0:
+        raise Exception(f"Linking {output} failed: {result.stderr.strip()}")
+    return output
+
+
+def write_header(compiler: Compiler, path: str):
+    root = compiler.getTree()
+    externs = {command.identifier for command in root.commands if isinstance(command, Extern)}
+    guard = "EZSCRIPT_" + "".join(c if c.isalnum() else "_" for c in os.path.basename(path)).upper()
+    lines = [f"#ifndef {guard}", f"#define {guard}", "", "#include <stdbool.h>", "#include <stdint.h>", ""]
+    for func in root.functions:
+        if func.name in externs:
+            continue
+        args = ", ".join(f"{C_TYPES[arg.type]} {arg.name}" for arg in func.args) or "void"
+        lines.append(f"{C_TYPES[func.ret]} {func.name}({args});")
+    lines += ["", f"#endif /* {guard} */", ""]
+    with open(path, "w") as f:
+        f.write("\n".join(lines))
+    return path
+
+
+def build_shared(compiler: Compiler, output: str, opt_level: Optional[int] = None, cpu: Optional[str] = None,
+                 libraries: List[str] = ()):
+    obj = os.path.splitext(output)[0] + ".o"
+    emit_object(compiler, obj, opt_level, cpu)
+    try:
+        return link_shared([obj], output, libraries)
+    finally:
+        os.remove(obj)
+
+
+def load_shared(path: str):
+    return ctypes.CDLL(os.path.abspath(path))
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(prog="ezscript-aot",
+                                     description="Compile an ezscript file ahead of time to native code")
+    parser.add_argument("source", help=".ez source file")
+    parser.add_argument("-o", "--output", help="output path, derived from the source name by default")
+    parser.add_argument("-O", dest="opt_level", type=int, default=2, choices=range(4), help="optimization level")
+    parser.add_argument("--emit", choices=EMIT_KINDS, default="so", help="artifact kind")
+    parser.add_argument("--cpu", help='target CPU, the host CPU by default ("generic" for portable code)')
+    parser.add_argument("--header", action="store_true", help="also write a C header next to the output")
+    parser.add_argument("-l", dest="libraries", action="append", default=[], help="library to link against")
+    args = parser.parse_args(argv)
+
+    name = os.path.splitext(os.path.basename(args.source))[0]
+    output = args.output or {"obj": f"{name}.o", "asm": f"{name}.s", "so": f"lib{name}.so"}[args.emit]
+    compiler = Compiler(name, Parser(Lexer.open(args.source)), args.opt_level)
+
+    if args.emit == "obj":
+        emit_object(compiler, output, cpu=args.cpu)
+    elif args.emit == "asm":
+        emit_assembly(compiler, output, cpu=args.cpu)
+    else:
+        build_shared(compiler, output, cpu=args.cpu, libraries=args.libraries)
+    if args.header:
+        write_header(compiler, os.path.splitext(output)[0] + ".h")
+    print(output)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,169 @@
+"""
+.ezbc artifacts: a built module as LLVM bitcode plus what is needed to call it.
+
+Layout, all integers little endian:
+
+    magic       4 bytes   b"EZBC"
+    format      u16       FORMAT_VERSION
+    length      u32       size of the header in bytes
+    header      length    UTF-8 JSON object, see below
+    bitcode     rest      the module as written by ModuleRef.as_bitcode()
+
+The header holds "compiler" (the VERSION that built it), "name", "triple",
+"data_layout", "cpu" and "features" (the target the bitcode was optimized for,
+"generic" and "" load on any host with the same triple), "opt_level",
+"source_hash", "externs", the names of the symbols the module leaves to the
+loader, and "functions", a list of {"name", "args": [[name, type], ...], "ret"}
+with types named after Types members (INT, FLOAT, BOOL, POINTER) and null for a
+missing return type.
+"""
+import json
+import os
+import struct
+import tempfile
+from typing import Dict, List, Optional
+
+import llvmlite.binding as llvm
+
+from src.ast import Extern, Function, Types, Variable
+from src.compile.compiler import Compiler, VERSION
+from src.compile.externs import symbols
+from src.compile.optimizer import create_target_machine, optimize
+from src.compile.session import JitSession, initialize
+from src.instrument import instrumentation
+
+MAGIC = b"EZBC"
+FORMAT_VERSION = 2
+GENERIC = "generic"
+SUFFIX = ".ezbc"
+PREFIX = struct.Struct("<4sHI")
+
+
+def encode_signature(func: Function):
+    return {"name": func.name, "args": [[arg.name, arg.type.name] for arg in func.args],
+            "ret": None if func.ret is None else func.ret.name}
+
+
+def decode_signature(data: Dict):
+    args = [Variable(name, Types[ty]) for name, ty in data["args"]]
+    return Function(data["name"], args, None if data["ret"] is None else Types[data["ret"]])
+
+
+def enabled(features: str):
+    return {feature[1:] for feature in features.split(",") if feature.startswith("+")}
+
+
+class Artifact:
+    def __init__(self, bitcode: bytes, signatures: List[Function], metadata: Optional[Dict] = None):
+        self.bitcode = bitcode
+        self.signatures = signatures
+        self.metadata = dict(metadata or {})
+
+    @property
+    def name(self):
+        return self.metadata.get("name")
+
+    @classmethod
+    def from_module(cls, mod, signatures, **metadata):
+        metadata.setdefault("compiler", VERSION)
+        metadata.setdefault("name", mod.name)
+        metadata.setdefault("triple", mod.triple)
+        metadata.setdefault("data_layout", mod.data_layout)
+        if metadata.get("cpu") is None:
+            metadata["cpu"] = llvm.get_host_cpu_name()
+            metadata["features"] = llvm.get_host_cpu_features().flatten()
+        metadata.setdefault("features", "")
+        # Whatever is still only declared after linking has to come from the loader
+        metadata.setdefault("externs", sorted(func.name for func in mod.functions
+                                              if func.is_declaration and not func.name.startswith("llvm.")))
+        if isinstance(signatures, dict):
+            signatures = list(signatures.values())
+        return cls(mod.as_bitcode(), list(signatures), metadata)
+
+    @classmethod
+    def from_compiler(cls, compiler: Compiler, session: JitSession, cpu: Optional[str] = None):
+        """
+        Lower and optimize compiler's tree for session's target, or for cpu (e.g.
+        "generic") on the same triple. The IR goes through text once here, everything
+        downstream only sees bitcode.
+        """
+        target_machine = session.target_machine if cpu is None else create_target_machine(session.opt_level, cpu=cpu)
+        compiler.compile(target_machine.target_data)
+        with instrumentation.phase("assemble"):
+            mod = llvm.parse_assembly(str(compiler.module))
+            mod.triple = target_machine.triple
+            mod.data_layout = str(target_machine.target_data)
+            mod.verify()
+        with instrumentation.phase("optimize"):
+            optimize(mod, session.opt_level, target_machine)
+        root = compiler.getTree()
+        externs = {command.identifier for command in root.commands if isinstance(command, Extern)}
+        signatures = [func for func in root.functions if func.name not in externs]
+        return cls.from_module(mod, signatures, name=compiler.name, opt_level=session.opt_level,
+                               source_hash=compiler.source_hash, cpu=cpu)
+
+    def module(self):
+        initialize()
+        mod = llvm.parse_bitcode(self.bitcode)
+        mod.verify()
+        return mod
+
+    def dumps(self):
+        header = dict(self.metadata, functions=[encode_signature(func) for func in self.signatures])
+        header = json.dumps(header, sort_keys=True).encode("utf-8")
+        return PREFIX.pack(MAGIC, FORMAT_VERSION, len(header)) + header + self.bitcode
+
+    @classmethod
+    def loads(cls, data: bytes):
+        if len(data) < PREFIX.size:
+            raise Exception("Not an ezscript artifact, it is too short")
+        magic, version, length = PREFIX.unpack_from(data)
+        if magic != MAGIC:
+            raise Exception("Not an ezscript artifact, bad magic")
+        if version != FORMAT_VERSION:
+            raise Exception(f"Unsupported artifact format {version}, expected {FORMAT_VERSION}")
+        header = json.loads(data[PREFIX.size:PREFIX.size + length].decode("utf-8"))
+        signatures = [decode_signature(func) for func in header.pop("functions")]
+        return cls(data[PREFIX.size + length:], signatures, header)
+
+    def write(self, path: str):
+        directory = os.path.dirname(os.path.abspath(path))
+        fd, tmp = tempfile.mkstemp(dir=directory, suffix=".tmp")
+        with os.fdopen(fd, "wb") as f:
+            f.write(self.dumps())
+        os.replace(tmp, path)
+        return path
+
+    @classmethod
+    def read(cls, path: str):
+        with open(path, "rb") as f:
+            return cls.loads(f.read())
+
+    def check(self, session: JitSession):
+        """
+        Raise unless the artifact was built by this compiler for a target session can run.
+        """
+        if self.metadata.get("compiler") != VERSION:
+            raise Exception(f"{self.name} was built by compiler {self.metadata.get('compiler')}, this is {VERSION}")
+        for field, expected in (("triple", session.target_machine.triple), ("data_layout", str(session.target_data))):
+            if self.metadata.get(field) != expected:
+                raise Exception(f"{self.name} targets {field} {self.metadata.get(field)!r}, the session {expected!r}")
+        cpu = self.metadata.get("cpu")
+        if cpu != GENERIC and cpu != llvm.get_host_cpu_name():
+            raise Exception(f"{self.name} was optimized for {cpu}, not {llvm.get_host_cpu_name()}, "
+                            f"build it for cpu {GENERIC!r} to load it anywhere")
+        missing = enabled(self.metadata.get("features", "")) - enabled(llvm.get_host_cpu_features().flatten())
+        if missing:
+            raise Exception(f"{self.name} needs CPU features this host lacks: {', '.join(sorted(missing))}")
+
+    def load_into(self, session: JitSession):
+        """
+        Check the artifact against session, bind its externs and add the module, no
+        IR text is printed or parsed on the way.
+        """
+        self.check(session)
+        # MCJIT aborts the process on symbols it cannot resolve, so check them up front
+        symbols.bind(name for name in self.metadata.get("externs", ()) if name not in session.signatures)
+        with instrumentation.phase("assemble"):
+            mod = self.module()
+        return session.add_module(mod, self.signatures)
@@ -0,0 +1,141 @@
+import argparse
+import os
+import sys
+from concurrent.futures import ProcessPoolExecutor
+from typing import Dict, List, Optional
+
+import llvmlite.binding as llvm
+
+from src import Lexer, Parser
+from src.ast import Extern, Function, Variable
+from src.compile.artifact import Artifact, SUFFIX as ARTIFACT_SUFFIX
+from src.compile.compiler import Compiler
+from src.compile.optimizer import check_opt_level, create_target_machine, optimize
+from src.compile.session import initialize
+from src.importer import FileImporter, SUFFIX
+
+
+class BuildResult:
+    def __init__(self, module, signatures: Dict, files: List[str]):
+        self.module = module
+        self.signatures = signatures
+        self.files = files
+
+
+def module_name(path: str):
+    return os.path.splitext(os.path.basename(path))[0]
+
+
+def compile_file(path: str, opt_level: int = 0, search_path: List[str] = (), declarations: Optional[Dict] = None,
+                 cpu: Optional[str] = None):
+    """
+    Lex, parse and lower a single file, returning it as optimized bitcode together
+    with the signatures of the functions it defines. Runs inside the build workers,
+    imports are resolved from declarations when discover already scanned them.
+    """
+    initialize()
+    target_machine = create_target_machine(opt_level, cpu=cpu)
+    parser = Parser(Lexer.open(path), FileImporter(os.path.dirname(path), search_path, declarations))
+    compiler = Compiler(module_name(path), parser, opt_level)
+    compiler.compile(target_machine.target_data)
+    mod = llvm.parse_assembly(str(compiler.module))
+    mod.name = path
+    mod.triple = target_machine.triple
+    mod.data_layout = str(target_machine.target_data)
+    mod.verify()
+    optimize(mod, opt_level, target_machine)
+    root = compiler.getTree()
+    externs = {command.identifier for command in root.commands if isinstance(command, Extern)}
+    # Only ship the signatures back, the function bodies are not needed after lowering
+    signatures = [Function(func.name, [Variable(arg.name, arg.type) for arg in func.args], func.ret)
+                  for func in root.functions if func.name not in externs]
+    return mod.as_bitcode(), signatures
+
+
+def discover(paths: List[str], search_path: List[str] = (), declarations: Optional[Dict] = None):
+    """
+    Every file reachable from paths through imports, in a stable order. The
+    declarations of every file are stored in declarations, keyed on their path.
+    """
+    declarations = {} if declarations is None else declarations
+    files = []
+    seen = set()
+    pending = [os.path.abspath(p) for p in paths]
+    while pending:
+        path = pending.pop(0)
+        if path in seen:
+            continue
+        seen.add(path)
+        files.append(path)
+        importer = FileImporter(os.path.dirname(path), search_path, declarations)
+        for name in importer.declarations(path)[1]:
+            pending.append(importer.find(name))
+    return files
+
+
+def build(paths: List[str], opt_level: int = 0, jobs: Optional[int] = None, search_path: List[str] = (),
+          cpu: Optional[str] = None):
+    """
+    Compile every file reachable from paths in parallel and link the results into one
+    module, tuned for cpu (e.g. "generic") or the host CPU.
+    """
+    check_opt_level(opt_level)
+    declarations = {}
+    files = discover(paths, search_path, declarations)
+    if jobs == 1 or len(files) == 1:
+        results = [compile_file(path, opt_level, search_path, declarations, cpu) for path in files]
+    else:
+        # Workers get the signatures discover already scanned instead of lexing the imports again
+        with ProcessPoolExecutor(max_workers=jobs) as pool:
+            results = list(pool.map(compile_file, files, [opt_level] * len(files), [search_path] * len(files),
+                                    [declarations] * len(files), [cpu] * len(files)))
+
+    initialize()
+    signatures = {}
+    linked = None
+    for path, (bitcode, functions) in zip(files, results):
+        mod = llvm.parse_bitcode(bitcode)
+        for func in functions:
+            if func.name in signatures:
+                raise Exception(f"Function {func.name} is defined more than once ({path})")
+            signatures[func.name] = func
+        if linked is None:
+            linked = mod
+            linked.name = module_name(files[0])
+        else:
+            linked.link_in(mod)
+    linked.verify()
+    # Cross file inlining only becomes possible after linking
+    if opt_level >= 2:
+        optimize(linked, opt_level, create_target_machine(opt_level, cpu=cpu))
+    return BuildResult(linked, signatures, files)
+
+
+def main(argv=None, prog="ezscript-build"):
+    parser = argparse.ArgumentParser(prog=prog, description="Build a multi-file ezscript program")
+    parser.add_argument("sources", nargs="+", help=".ez source files, imports are followed automatically")
+    parser.add_argument("-o", "--output", help="write the linked module as bitcode to this path, "
+                                                "an .ezbc path also stores the function signatures")
+    parser.add_argument("-O", dest="opt_level", type=int, default=0, choices=range(4), help="optimization level")
+    parser.add_argument("-j", "--jobs", type=int, help="worker processes, one per core by default")
+    parser.add_argument("-I", dest="search_path", action="append", default=[], help="import search directory")
+    parser.add_argument("--emit-llvm", action="store_true", help="write textual IR instead of bitcode")
+    parser.add_argument("--cpu", help="CPU to tune for instead of the host, generic loads on any host of this triple")
+    args = parser.parse_args(argv)
+
+    result = build(args.sources, args.opt_level, args.jobs, args.search_path, args.cpu)
+    output = args.output or module_name(args.sources[0]) + (".ll" if args.emit_llvm else ".bc")
+    if args.emit_llvm:
+        with open(output, "w") as f:
+            f.write(str(result.module))
+    elif output.endswith(ARTIFACT_SUFFIX):
+        Artifact.from_module(result.module, result.signatures, opt_level=args.opt_level, cpu=args.cpu).write(output)
+    else:
+        with open(output, "wb") as f:
+            f.write(result.module.as_bitcode())
+    print(output)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,100 @@
+import hashlib
+import os
+import tempfile
+
+from src.compile.compiler import VERSION
+
+
+class ObjectCache:
+    """
+    Content addressed on-disk cache of the machine code MCJIT emits for a module.
+    Entries are keyed on the compiler's fingerprint, compiler version, optimization
+    level and target, and the least recently used entries are evicted once the directory
+    grows past max_size bytes.
+    """
+    SUFFIX = ".o"
+
+    def __init__(self, directory: str, max_size: int = 256 * 1024 * 1024):
+        self.directory = directory
+        self.max_size = max_size
+        self.hits = 0
+        self.misses = 0
+        os.makedirs(directory, exist_ok=True)
+
+    @staticmethod
+    def key(fingerprint: str, opt_level: int, triple: str, cpu: str = ""):
+        parts = [fingerprint, VERSION, str(opt_level), triple, cpu]
+        return hashlib.sha256("\0".join(parts).encode("utf-8")).hexdigest()
+
+    def __path(self, key: str):
+        return os.path.join(self.directory, key + self.SUFFIX)
+
+    def load(self, key: str):
+        path = self.__path(key)
+        try:
+            with open(path, "rb") as f:
+                data = f.read()
+        except FileNotFoundError:
+            self.misses += 1
+            return None
+        # Bump the modification time so eviction sees this entry as recently used
+        os.utime(path)
+        self.hits += 1
+        return data
+
+    def store(self, key: str, data: bytes):
+        fd, tmp = tempfile.mkstemp(dir=self.directory, suffix=".tmp")
+        with os.fdopen(fd, "wb") as f:
+            f.write(data)
+        os.replace(tmp, self.__path(key))
+        self.evict()
+
+    def entries(self):
+        entries = []
+        for entry in os.scandir(self.directory):
+            if entry.is_file() and entry.name.endswith(self.SUFFIX):
+                stat = entry.stat()
+                entries.append((stat.st_mtime, stat.st_size, entry.path))
+        return entries
+
+    def evict(self):
+        entries = sorted(self.entries())
+        size = sum(e[1] for e in entries)
+        removed = 0
+        for _, entry_size, path in entries:
+            if size <= self.max_size:
+                break
+            try:
+                os.remove(path)
+            except FileNotFoundError:
+                pass
+            size -= entry_size
+            removed += 1
+        return removed
+
+    def clear(self):
+        for _, _, path in self.entries():
+            os.remove(path)
+
+    def stats(self):
+        entries = self.entries()
+        return {"hits": self.hits, "misses": self.misses,
+                "entries": len(entries), "size": sum(e[1] for e in entries)}
+
+    def attach(self, engine, key: str, cached: bytes = None, emitted=None):
+        """
+        Hook the cache into an MCJIT engine: cached code is handed back instead of
+        running the backend, and freshly emitted code is stored under key. Only the
+        module named key is cached, every other module in the engine is compiled as usual.
+        emitted(module, buffer) is called for all code the engine emits.
+        """
+        def notify(module, buffer):
+            if emitted is not None:
+                emitted(module, buffer)
+            if module.name == key:
+                self.store(key, buffer)
+
+        def get_buffer(module):
+            return cached if module.name == key else None
+
+        engine.set_object_cache(notify, get_buffer)
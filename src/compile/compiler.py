@@ -1,9 +1,13 @@
+import json
 from typing import Union, Dict
 
 from llvmlite.binding import TargetData
 
-from src.ast import Extern, Function, FunctionCall, Value, ExpressionType, Return, Types, SetVariable, Variable
+from src.ast import Extern, Function, FunctionCall, Value, ExpressionType, Return, Types, SetVariable, Variable, Scope
 from src.parser import Parser
+from src.passes import fold_constants, resolve_types, eliminate_dead_code
+from src.compile.optimizer import check_opt_level
+from src.instrument import instrumentation
 from llvmlite import ir, binding
 
 
@@ -15,28 +19,103 @@ byte = ir.IntType(8)
 boolean = ir.IntType(1)
 und = ir.Undefined
 
+VERSION = "0.1.0"
+
+
+def slot_name(name: str):
+    return f"{name}__slot"
+
+
+def count_instructions(module: ir.Module):
+    return sum(len(block.instructions) for func in module.functions for block in func.blocks)
+
 
 class Compiler:
-    def __init__(self, file_name: str, parser: Parser):
+    def __init__(self, file_name: str, parser: Union[Parser, Scope], opt_level: int = 0, fold: bool = True,
+                 roots=None):
         self.__file_name = file_name
-        self.__parser = parser
-        self.__parser.parse()
-        self.__root = self.__parser.getTree()
+        self.opt_level = check_opt_level(opt_level)
+        if isinstance(parser, Scope):
+            # An already parsed tree, the passes below leave trees they already ran on unchanged
+            self.__parser = None
+            self.source_hash = None
+            self.__root = parser
+        else:
+            self.__parser = parser
+            self.__parser.parse()
+            # Streaming lexers only know the hash after the whole source was read
+            self.source_hash = parser.sourceHash()
+            self.__root = self.__parser.getTree()
+        self.fold = fold
+        self.roots = None if roots is None else sorted(set(roots))
+        self.folded_nodes = 0
+        if fold:
+            with instrumentation.phase("fold") as phase:
+                self.folded_nodes = fold_constants(self.__root)
+                if phase:
+                    phase.counters["removed_nodes"] = self.folded_nodes
+        with instrumentation.phase("types"):
+            resolve_types(self.__root)
+        # Every function is kept unless roots are given, JIT sessions can call any of them
+        with instrumentation.phase("dead_code") as phase:
+            self.eliminated = eliminate_dead_code(self.__root, roots)
+            if phase:
+                phase.counters["functions"] = len(self.eliminated.functions)
+                phase.counters["stores"] = self.eliminated.stores
+                phase.counters["unreachable"] = self.eliminated.unreachable
         self.__target_data = None
         self.__externals = set()
         self.__functions = {}
+        self.__signatures = {}
+        self.__slots = None
+        self.__defined = None
         self.__variables = None
         self.module: ir.Module = None
 
-    def compile(self, target_data: TargetData):
-        self.__target_data = target_data
-        self.module = ir.Module(name=self.__file_name)
-        for command in self.__root.commands:
-            if type(command) is Extern:
-                self.__compile_extern(command)
+    @property
+    def name(self):
+        return self.__file_name
+
+    def fingerprint(self):
+        """
+        Everything besides the target that decides the generated code: the source, the
+        passes and roots, and the signatures of externs and imported functions. None for
+        a tree handed in already parsed, there is no source to hash.
+        """
+        if self.source_hash is None:
+            return None
+        externs = sorted([command.identifier, [arg.type.name for arg in command.function.args],
+                          None if command.function.ret is None else command.function.ret.name]
+                         for command in self.__root.commands if isinstance(command, Extern))
+        return json.dumps([self.source_hash, self.fold, self.roots, externs])
 
-        for func in self.__root.functions:
-            self.__compile_function(func)
+    def getTree(self):
+        return self.__root
+
+    def compile(self, target_data: TargetData, functions=None, slots: bool = False):
+        """
+        Lower the tree into self.module. If functions is given, only the functions
+        with those names are defined and the ones they call are just declared. With
+        slots, calls to functions defined elsewhere load the callee from the global
+        slot_name(callee) instead, so the caller can be linked before the callee exists.
+        """
+        with instrumentation.phase("ir") as phase:
+            self.__target_data = target_data
+            self.__externals = set()
+            self.__functions = {}
+            self.__slots = {} if slots and functions is not None else None
+            self.__defined = functions
+            self.__signatures = {func.name: func for func in self.__root.functions}
+            self.module = ir.Module(name=self.__file_name)
+            for command in self.__root.commands:
+                if type(command) is Extern:
+                    self.__compile_extern(command)
+
+            for func in self.__root.functions:
+                if functions is None or func.name in functions:
+                    self.__compile_function(func)
+            if phase:
+                phase.counters["instructions"] = count_instructions(self.module)
 
     def compile_args(self, args):
         arr = []
@@ -49,10 +128,7 @@ class Compiler:
         if func.name in self.__externals:
             return
         self.__variables = {}
-        ret = integer if func.ret is None else self.__toType(func.ret)
-        func_type = ir.FunctionType(ret, self.compile_args(func.args))
-        ir_func = ir.Function(self.module, func_type, func.name)
-        self.__functions[func.name] = ir_func
+        ir_func = self.__declare_function(func)
         func_block = ir_func.append_basic_block(name="entry")
         builder = ir.IRBuilder(func_block)
 
@@ -64,75 +140,138 @@ class Compiler:
                 self.__compile_function_call(builder, command)
             elif isinstance(command, Return):
                 value = self.__compile_value(builder, command.value)
-                builder.ret(value)
+                builder.ret(self.__convert(builder, value, command.value.value_type, command.value_type))
                 return
             elif isinstance(command, SetVariable):
                 self.__compile_variable(builder, command)
-        builder.ret(ir.Constant(byte, 0))
-
-    def __compile_value(self, builder: ir.IRBuilder, value: Value):
-        if value.type == ExpressionType.VALUE:
-            if isinstance(v := value.value, float):
-                return ir.Constant(double, v)
-            elif isinstance(v := value.value, int):
-                return ir.Constant(integer, v)
-            elif isinstance(v := value.value, FunctionCall):
-                return self.__compile_function_call(builder, v)
-            elif isinstance(v := value.value, Variable):
-                return self.__compile_variable(builder, v)
-        elif value.type == ExpressionType.REFERENCE and isinstance(value.value, Variable):
-            variable = self.__variables[value.value.name]
-            return variable
-        elif value.type == ExpressionType.DEREFERENCE and isinstance(value.value, Variable):
-            variable = self.__compile_variable(builder, value.value)
-            return builder.load(variable)
-        left = self.__compile_value(builder, value.left)
-        right = self.__compile_value(builder, value.right)
-        if value.type == ExpressionType.ADD:
-            if left.type == right.type == double:
-                return builder.fadd(left, right)
-            elif left.type == right.type == integer:
-                return builder.add(left, right)
-        elif value.type == ExpressionType.MINUS:
-            if left.type == right.type == double:
-                return builder.fsub(left, right)
-            elif left.type == right.type == integer:
-                return builder.sub(left, right)
-        elif value.type == ExpressionType.MULTIPLY:
-            if left.type == right.type == double:
-                return builder.fmul(left, right)
-            elif left.type == right.type == integer:
-                return builder.mul(left, right)
-        elif value.type == ExpressionType.DIVIDE:
-            if left.type == right.type == double:
-                return builder.fdiv(left, right)
-            elif left.type == right.type == integer:
-                return builder.sdiv(left, right)
+        builder.ret(ir.Constant(ir_func.function_type.return_type, 0))
+
+    def __compile_value(self, builder: ir.IRBuilder, value: Union[Value, FunctionCall]):
+        # Post-order over the expression with an explicit stack, operands are emitted
+        # left to right and their results collected on another stack
+        results = []
+        stack = [(value, False)]
+        while stack:
+            node, expanded = stack.pop()
+            if isinstance(node, FunctionCall):
+                if not expanded:
+                    stack.append((node, True))
+                    stack += [(arg, False) for arg in reversed(node.args)]
+                    continue
+                args = results[len(results) - len(node.args):]
+                del results[len(results) - len(node.args):]
+                params = self.__signatures[node.name].args
+                args = [self.__convert(builder, value, arg.value_type, param.type)
+                        for value, arg, param in zip(args, node.args, params)]
+                results.append(builder.call(self.__callee(builder, node.name), args))
+            elif node.type == ExpressionType.VALUE:
+                if isinstance(v := node.value, float):
+                    results.append(ir.Constant(double, v))
+                elif isinstance(v, int):
+                    results.append(ir.Constant(integer, v))
+                elif isinstance(v, FunctionCall):
+                    stack.append((v, False))
+                elif isinstance(v, Variable):
+                    results.append(self.__compile_variable(builder, v))
+            elif node.type == ExpressionType.REFERENCE and isinstance(node.value, Variable):
+                results.append(self.__address(builder, node.value.name))
+            elif node.type == ExpressionType.DEREFERENCE and isinstance(node.value, Variable):
+                variable = self.__compile_variable(builder, node.value)
+                results.append(builder.load(variable))
+            elif node.type == ExpressionType.NEGATE:
+                if not expanded:
+                    stack += [(node, True), (node.left, False)]
+                    continue
+                operand = self.__convert(builder, results.pop(), node.left.value_type, node.value_type)
+                results.append(builder.fneg(operand) if node.value_type == Types.FLOAT else builder.neg(operand))
+            elif not expanded:
+                stack += [(node, True), (node.right, False), (node.left, False)]
+            else:
+                right = self.__convert(builder, results.pop(), node.right.value_type, node.value_type)
+                left = self.__convert(builder, results.pop(), node.left.value_type, node.value_type)
+                results.append(self.__compile_binary(builder, node.type, node.value_type, left, right))
+        return results[0]
+
+    @staticmethod
+    def __compile_binary(builder: ir.IRBuilder, op: ExpressionType, ty: Types, left, right):
+        # The type pass already promoted both operands to ty
+        if op == ExpressionType.ADD:
+            return builder.fadd(left, right) if ty == Types.FLOAT else builder.add(left, right)
+        elif op == ExpressionType.MINUS:
+            return builder.fsub(left, right) if ty == Types.FLOAT else builder.sub(left, right)
+        elif op == ExpressionType.MULTIPLY:
+            return builder.fmul(left, right) if ty == Types.FLOAT else builder.mul(left, right)
+        elif op == ExpressionType.DIVIDE:
+            return builder.fdiv(left, right) if ty == Types.FLOAT else builder.sdiv(left, right)
+
+    @staticmethod
+    def __convert(builder: ir.IRBuilder, value, source: Types, target: Types):
+        if source == target or source is None or target is None or Types.POINTER in (source, target):
+            return value
+        if target == Types.FLOAT:
+            return builder.uitofp(value, double) if source == Types.BOOL else builder.sitofp(value, double)
+        elif target == Types.INT:
+            return builder.fptosi(value, integer) if source == Types.FLOAT else builder.zext(value, integer)
+        elif source == Types.FLOAT:
+            return builder.fcmp_unordered("!=", value, ir.Constant(double, 0))
+        return builder.icmp_signed("!=", value, ir.Constant(integer, 0))
+
+    def __declare_function(self, func: Function):
+        if func.name in self.__functions:
+            return self.__functions[func.name]
+        ret = integer if func.ret is None else self.__toType(func.ret)
+        func_type = ir.FunctionType(ret, self.compile_args(func.args))
+        ir_func = ir.Function(self.module, func_type, func.name)
+        self.__functions[func.name] = ir_func
+        return ir_func
+
+    def __function(self, name: str):
+        if name not in self.__functions:
+            return self.__declare_function(self.__signatures[name])
+        return self.__functions[name]
+
+    def __callee(self, builder: ir.IRBuilder, name: str):
+        if self.__slots is None or name in self.__externals or name in self.__defined:
+            return self.__function(name)
+        if name not in self.__slots:
+            func = self.__signatures[name]
+            ret = integer if func.ret is None else self.__toType(func.ret)
+            func_type = ir.FunctionType(ret, self.compile_args(func.args))
+            self.__slots[name] = ir.GlobalVariable(self.module, func_type.as_pointer(), slot_name(name))
+        return builder.load(self.__slots[name])
 
     def __compile_function_call(self, builder: ir.IRBuilder, c: FunctionCall):
-        return builder.call(self.__functions[c.name], [self.__compile_value(builder, arg) for arg in c.args])
+        return self.__compile_value(builder, c)
 
     def __compile_variable(self, builder: ir.IRBuilder, c: Union[SetVariable, Variable]):
         if isinstance(c, SetVariable):
             value = self.__compile_value(builder, c.value)
-            if c.name not in self.__variables:
-                self.__variables[c.name] = builder.alloca(value.type)
+            value = self.__convert(builder, value, c.value.value_type, c.value_type)
             align = value.type.get_abi_alignment(self.__target_data)
             # print(f"Alignment: {align}")
-            ptr = self.__variables[c.name] if not c.deref else builder.load(self.__variables[c.name])
-            builder.store(value, ptr)
+            ptr = self.__address(builder, c.name, value.type)
+            builder.store(value, ptr if not c.deref else builder.load(ptr))
         elif isinstance(c, Variable):
             p = self.__variables[c.name]
-            value = builder.load(p) if p.type.is_pointer else p
+            value = p if isinstance(p, ir.Argument) else builder.load(p)
             return value
 
+    def __address(self, builder: ir.IRBuilder, name: str, ty=None):
+        p = self.__variables.get(name)
+        if p is None:
+            p = self.__variables[name] = builder.alloca(ty)
+        elif isinstance(p, ir.Argument):
+            # Arguments live in registers until they are assigned to or their address is taken
+            slot = builder.alloca(p.type)
+            builder.store(p, slot)
+            p = self.__variables[name] = slot
+        return p
+
     def __compile_extern(self, extern: Extern):
-        if extern.identifier == "abs":
-            ret = integer if extern.function.ret is None else self.__toType(extern.function.ret)
-            func_type = ir.FunctionType(ret, self.compile_args(extern.function.args))
-            func = ir.Function(self.module, func_type, name="abs")
-            self.__functions["abs"] = func
-            self.__externals.add("abs")
+        # Externs are only declared here, the JIT resolves them against the process
+        # and every module added before this one
+        self.__declare_function(extern.function)
+        self.__externals.add(extern.identifier)
 
     def __toType(self, ty: Types):
         if ty == Types.INT:
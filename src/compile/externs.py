@@ -0,0 +1,96 @@
+import ctypes.util
+import os
+import threading
+from ctypes import CFUNCTYPE, c_bool, c_double, c_int32, c_void_p, cast
+from functools import lru_cache
+from typing import Callable, Optional, Sequence
+
+import llvmlite.binding as llvm
+
+from src.ast import Types
+
+CTYPES = {Types.INT: c_int32, Types.FLOAT: c_double, Types.BOOL: c_bool, Types.POINTER: c_void_p, None: c_int32}
+
+DEFAULT_LIBRARIES = ("c", "m")
+
+
+@lru_cache(maxsize=None)
+def prototype(ret: Optional[Types], *args: Types):
+    """
+    The ctypes prototype for a signature, shared by every function with the same one.
+    """
+    return CFUNCTYPE(CTYPES[ret], *[CTYPES[arg] for arg in args])
+
+
+def find_library(name: str):
+    if os.sep in name or name.endswith(".so") or ".so." in name:
+        if not os.path.exists(name):
+            raise Exception(f"Cannot find library {name}")
+        return os.path.abspath(name)
+    path = ctypes.util.find_library(name)
+    if path is None:
+        raise Exception(f"Cannot find library {name}")
+    return path
+
+
+class SymbolCache:
+    """
+    Process-wide table of the native symbols extern declarations bind to. Libraries
+    are loaded into the process once, every symbol is looked up at most once and
+    Python callbacks are registered with the JIT under the name code calls them by.
+    """
+
+    def __init__(self, libraries: Sequence[str] = DEFAULT_LIBRARIES):
+        self.libraries = {}
+        self.symbols = {}
+        self.__defaults = list(libraries)
+        self.__callbacks = {}
+        self.__lock = threading.RLock()
+
+    def load_library(self, name: str):
+        """
+        Load a library by short name (m, c) or path and return the path it was loaded from.
+        """
+        with self.__lock:
+            if name not in self.libraries:
+                path = find_library(name)
+                llvm.load_library_permanently(path)
+                self.libraries[name] = path
+            return self.libraries[name]
+
+    def add_symbol(self, name: str, address: int):
+        with self.__lock:
+            llvm.add_symbol(name, address)
+            self.symbols[name] = address
+
+    def add_callback(self, name: str, callback: Callable, ret: Optional[Types] = Types.INT, args: Sequence[Types] = ()):
+        """
+        Make callback callable from compiled code as the extern name(args): ret.
+        """
+        function = prototype(ret, *args)(callback)
+        # ctypes frees the trampoline with the function object, keep it alive for good
+        self.__callbacks[name] = function
+        self.add_symbol(name, cast(function, c_void_p).value)
+        return function
+
+    def resolve(self, name: str):
+        """
+        The address of the symbol called name, or None if no loaded library defines it.
+        """
+        if name in self.symbols:
+            return self.symbols[name]
+        with self.__lock:
+            while self.__defaults:
+                self.load_library(self.__defaults.pop(0))
+            address = llvm.address_of_symbol(name)
+            if address is not None:
+                self.symbols[name] = address
+            return address
+
+    def bind(self, names):
+        missing = [name for name in names if self.resolve(name) is None]
+        if missing:
+            raise Exception(f"Unresolved externs: {', '.join(missing)}")
+
+
+symbols = SymbolCache()
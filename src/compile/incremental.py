@@ -0,0 +1,148 @@
+import hashlib
+import json
+import os
+from typing import Dict, List, Optional
+
+import llvmlite.binding as llvm
+
+from src.ast import Extern, Function, FunctionCall, Return, SetVariable, Value, Variable, walk, children, calls
+from src.compile.compiler import Compiler, VERSION
+from src.compile.optimizer import check_opt_level, create_target_machine, optimize
+from src.compile.session import initialize
+
+
+def signature(func: Function):
+    args = ",".join(str(arg.type) for arg in func.args)
+    return f"{func.name}({args}):{func.ret}"
+
+
+def fingerprint(func: Function, signatures: Dict[str, Function]):
+    """
+    Hash of the function's own tree together with the signatures of everything it calls,
+    so a function is rebuilt when its body or a callee's interface changes.
+    """
+    digest = hashlib.sha256(signature(func).encode("utf-8"))
+    for node in walk(func):
+        if isinstance(node, Value):
+            literal = node.value if isinstance(node.value, (int, float, str)) else None
+            token = f"V{node.type.name}:{literal!r}"
+        elif isinstance(node, Variable):
+            token = f"v{node.name}:{node.type}"
+        elif isinstance(node, FunctionCall):
+            token = f"c{node.name}"
+        elif isinstance(node, SetVariable):
+            token = f"s{node.name}:{node.deref}"
+        elif isinstance(node, Return):
+            token = "r"
+        else:
+            token = type(node).__name__
+        digest.update(f"{token}/{len(children(node))};".encode("utf-8"))
+    for callee in sorted(set(calls(func))):
+        digest.update(signature(signatures[callee]).encode("utf-8") if callee in signatures else callee.encode())
+    return digest.hexdigest()
+
+
+class IncrementalResult:
+    def __init__(self, module, signatures: Dict[str, Function], rebuilt: List[str], reused: List[str],
+                 removed: List[str]):
+        self.module = module
+        self.signatures = signatures
+        self.rebuilt = rebuilt
+        self.reused = reused
+        self.removed = removed
+
+
+class IncrementalBuilder:
+    """
+    Keeps the bitcode of every function from the previous build and only lowers the
+    functions whose fingerprint changed. Each function lives in its own module, so
+    cross function inlining is left to a full build. With a directory the per function
+    bitcode survives between processes.
+    """
+    INDEX = "index.json"
+
+    def __init__(self, opt_level: int = 0, directory: Optional[str] = None):
+        initialize()
+        self.opt_level = check_opt_level(opt_level)
+        self.directory = directory
+        self.target_machine = create_target_machine(opt_level)
+        self.__entries = {}
+        if directory is not None:
+            self.__load_index()
+
+    def build(self, compiler: Compiler):
+        root = compiler.getTree()
+        externs = {command.identifier for command in root.commands if isinstance(command, Extern)}
+        signatures = {func.name: func for func in root.functions}
+        functions = [func for func in root.functions if func.name not in externs]
+
+        rebuilt, reused = [], []
+        entries = {}
+        for func in functions:
+            digest = fingerprint(func, signatures)
+            entry = self.__entries.get(func.name)
+            if entry is not None and entry[0] == digest:
+                entries[func.name] = entry
+                reused.append(func.name)
+            else:
+                entries[func.name] = (digest, self.__compile_function(compiler, func.name))
+                rebuilt.append(func.name)
+        removed = [name for name in self.__entries if name not in entries]
+        self.__entries = entries
+        if self.directory is not None:
+            self.__save_index()
+
+        linked = None
+        for func in functions:
+            mod = llvm.parse_bitcode(entries[func.name][1])
+            if linked is None:
+                linked = mod
+            else:
+                linked.link_in(mod)
+        if linked is None:
+            linked = llvm.parse_assembly("")
+        linked.name = compiler.name
+        linked.verify()
+        return IncrementalResult(linked, {func.name: func for func in functions}, rebuilt, reused, removed)
+
+    def __compile_function(self, compiler: Compiler, name: str):
+        compiler.compile(self.target_machine.target_data, {name})
+        mod = llvm.parse_assembly(str(compiler.module))
+        mod.triple = self.target_machine.triple
+        mod.data_layout = str(self.target_machine.target_data)
+        mod.verify()
+        optimize(mod, self.opt_level, self.target_machine)
+        return mod.as_bitcode()
+
+    def __index_key(self):
+        return f"{VERSION}:{self.opt_level}:{self.target_machine.triple}:{llvm.get_host_cpu_name()}"
+
+    def __load_index(self):
+        os.makedirs(self.directory, exist_ok=True)
+        try:
+            with open(os.path.join(self.directory, self.INDEX)) as f:
+                index = json.load(f)
+        except FileNotFoundError:
+            return
+        if index.get("key") != self.__index_key():
+            return
+        for name, digest in index["functions"].items():
+            try:
+                with open(os.path.join(self.directory, digest + ".bc"), "rb") as f:
+                    self.__entries[name] = (digest, f.read())
+            except FileNotFoundError:
+                pass
+
+    def __save_index(self):
+        live = {digest for digest, _ in self.__entries.values()}
+        for name, (digest, bitcode) in self.__entries.items():
+            path = os.path.join(self.directory, digest + ".bc")
+            if not os.path.exists(path):
+                with open(path, "wb") as f:
+                    f.write(bitcode)
+        for entry in os.scandir(self.directory):
+            if entry.name.endswith(".bc") and entry.name[:-3] not in live:
+                os.remove(entry.path)
+        index = {"key": self.__index_key(), "functions": {name: e[0] for name, e in self.__entries.items()}}
+        with open(os.path.join(self.directory, self.INDEX), "w") as f:
+            json.dump(index, f)
@@ -0,0 +1,87 @@
+import threading
+from ctypes import c_void_p, cast
+from typing import Optional
+
+import llvmlite.binding as llvm
+from llvmlite import ir
+
+from src.ast import Extern
+from src.compile.compiler import Compiler, slot_name
+from src.compile.externs import prototype, symbols
+from src.compile.optimizer import optimize
+from src.compile.session import JitSession
+from src.instrument import instrumentation
+
+pointer = ir.IntType(8).as_pointer()
+
+
+class LazyJit:
+    """
+    Compiles the functions of a program one at a time, each into its own module, the
+    first time they are called. Calls between them go through a global slot per
+    function which points to a stub until the callee has been compiled.
+    """
+
+    def __init__(self, compiler: Compiler, session: Optional[JitSession] = None):
+        self.compiler = compiler
+        self.session = JitSession(compiler.opt_level) if session is None else session
+        tree = compiler.getTree()
+        externs = {command.identifier for command in tree.commands if isinstance(command, Extern)}
+        symbols.bind(name for name in externs if name not in self.session.signatures)
+        self.functions = {func.name: func for func in tree.functions if func.name not in externs}
+        self.compiled = {}
+        self.__lock = threading.RLock()
+        self.__stubs = {}
+        self.__slots = {}
+
+        mod = ir.Module(name=f"{compiler.name}.slots")
+        for name in self.functions:
+            slot = ir.GlobalVariable(mod, pointer, slot_name(name))
+            slot.initializer = ir.Constant(pointer, None)
+        self.session.add_module(llvm.parse_assembly(str(mod)))
+        for name, func in self.functions.items():
+            # The stub has to outlive every slot that points to it
+            stub = self.__stubs[name] = prototype(func.ret, *[arg.type for arg in func.args])(self.__stub(name))
+            slot = self.__slots[name] = c_void_p.from_address(
+                self.session.engine.get_global_value_address(slot_name(name)))
+            slot.value = cast(stub, c_void_p).value
+
+    def __stub(self, name: str):
+        def stub(*args):
+            return self.compile(name)(*args)
+        return stub
+
+    def compile(self, name: str):
+        """
+        Compile the function called name if it has not been yet and return it as a
+        ctypes callable. The functions it calls are left alone.
+        """
+        if name in self.compiled:
+            return self.compiled[name]
+        if name not in self.functions:
+            raise Exception(f"Function {name} is not defined in {self.compiler.name}")
+        with self.__lock:
+            if name in self.compiled:
+                return self.compiled[name]
+            self.compiler.compile(self.session.target_data, [name], slots=True)
+            with instrumentation.phase("assemble"):
+                mod = llvm.parse_assembly(str(self.compiler.module))
+                mod.name = f"{self.compiler.name}.{name}"
+                mod.verify()
+            with instrumentation.phase("optimize"):
+                optimize(mod, self.session.opt_level, self.session.target_machine)
+            self.session.add_module(mod, [self.functions[name]])
+            self.__slots[name].value = self.session.address(name)
+            self.compiled[name] = self.session.function(name)
+        return self.compiled[name]
+
+    def function(self, name: str):
+        """
+        A callable for the function called name which compiles it on the first call.
+        """
+        if name not in self.functions:
+            raise Exception(f"Function {name} is not defined in {self.compiler.name}")
+
+        def call(*args):
+            return self.compile(name)(*args)
+        return call
@@ -0,0 +1,76 @@
+import os
+
+import llvmlite.binding as llvm
+
+OPT_LEVELS = (0, 1, 2, 3)
+INLINING_THRESHOLDS = {1: 0, 2: 225, 3: 275}
+
+
+def check_opt_level(opt_level: int):
+    if opt_level not in OPT_LEVELS:
+        raise Exception(f"Invalid optimization level {opt_level}, expected one of {OPT_LEVELS}")
+    return opt_level
+
+
+def create_target_machine(opt_level=0, reloc="default", codemodel="jitdefault", cpu=None, features=None):
+    """
+    Create a TargetMachine for the host, tuned for the host CPU name and features
+    unless a cpu (e.g. "generic") and feature string are given.
+    """
+    target = llvm.Target.from_default_triple()
+    if cpu is None:
+        cpu = llvm.get_host_cpu_name()
+        features = llvm.get_host_cpu_features().flatten() if features is None else features
+    return target.create_target_machine(cpu=cpu, features=features or "",
+                                        opt=min(check_opt_level(opt_level), 3),
+                                        reloc=reloc, codemodel=codemodel)
+
+
+def create_pass_manager(opt_level: int, target_machine=None):
+    pm = llvm.create_module_pass_manager()
+    if target_machine is not None:
+        target_machine.add_analysis_passes(pm)
+    if check_opt_level(opt_level) == 0:
+        return pm
+
+    # Promote the allocas every variable gets to registers first, everything else relies on it
+    pm.add_sroa_pass()
+    pm.add_instruction_combining_pass()
+    pm.add_cfg_simplification_pass()
+    if opt_level >= 2:
+        pm.add_function_inlining_pass(INLINING_THRESHOLDS[opt_level])
+        pm.add_sccp_pass()
+        pm.add_reassociate_expressions_pass()
+        pm.add_gvn_pass()
+        pm.add_dead_store_elimination_pass()
+        pm.add_licm_pass()
+    if opt_level >= 3:
+        pm.add_aggressive_instruction_combining_pass()
+        pm.add_aggressive_dead_code_elimination_pass()
+        pm.add_global_dce_pass()
+
+    builder = llvm.create_pass_manager_builder()
+    builder.opt_level = opt_level
+    builder.inlining_threshold = INLINING_THRESHOLDS[opt_level]
+    builder.loop_vectorize = opt_level >= 3
+    builder.slp_vectorize = opt_level >= 3
+    builder.populate(pm)
+    return pm
+
+
+def optimize(mod, opt_level: int, target_machine=None):
+    """
+    Run the pass pipeline for opt_level over a parsed llvmlite.binding module in place.
+    Returns True if any pass changed the module.
+    """
+    if check_opt_level(opt_level) == 0:
+        return False
+    return create_pass_manager(opt_level, target_machine).run(mod)
+
+
+def dump_ir(directory: str, name: str, stage: str, llvm_ir):
+    os.makedirs(directory, exist_ok=True)
+    path = os.path.join(directory, f"{name}.{stage}.ll")
+    with open(path, "w") as f:
+        f.write(str(llvm_ir))
+    return path
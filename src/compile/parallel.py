@@ -0,0 +1,92 @@
+import array
+import os
+from concurrent.futures import ThreadPoolExecutor
+from typing import Optional
+
+from src.ast import Types
+from src.compile.vectorize import DTYPES, TYPECODES, allocate, numpy
+
+# Smaller chunks cost more in thread handoffs than they win in balance
+MIN_CHUNK = 1 << 12
+
+
+def chunks(n: int, workers: int, chunk_size: Optional[int] = None):
+    if chunk_size is None:
+        chunk_size = max(MIN_CHUNK, -(-n // (workers * 4)))
+    return [(start, min(start + chunk_size, n)) for start in range(0, n, chunk_size)]
+
+
+def materialize(arg, ty: Types):
+    """
+    A sliceable contiguous buffer of ty for arg, ranges are expanded into arrays.
+    """
+    if isinstance(arg, range):
+        if numpy is not None:
+            return numpy.arange(arg.start, arg.stop, arg.step, DTYPES[ty])
+        return array.array(TYPECODES[ty], arg)
+    if numpy is not None:
+        return numpy.ascontiguousarray(arg, DTYPES[ty])
+    return memoryview(arg)
+
+
+def prepare(vectorized, args):
+    if len(args) != len(vectorized.args) or not args:
+        raise Exception(f"{vectorized.name} takes {len(vectorized.args)} arrays, got {len(args)}")
+    args = [materialize(arg, ty) for arg, ty in zip(args, vectorized.args)]
+    if any(len(arg) != len(args[0]) for arg in args):
+        raise Exception(f"Arguments of {vectorized.name} have different lengths")
+    return args, len(args[0])
+
+
+def parallel_map(session, name: str, *args, out=None, workers: Optional[int] = None,
+                 chunk_size: Optional[int] = None):
+    """
+    Apply the function called name element-wise over args like JitSession.vectorize,
+    split into chunks run on a thread pool. ctypes releases the GIL for the duration
+    of each native call, so the chunks run on every core at once.
+    """
+    vectorized = session.vectorize(name)
+    workers = workers or os.cpu_count() or 1
+    args, n = prepare(vectorized, args)
+    if out is None:
+        out = allocate(n, vectorized.ret)
+    view = out if numpy is not None and isinstance(out, numpy.ndarray) else memoryview(out)
+    if len(view) != n:
+        raise Exception(f"Output of {name} has {len(view)} elements, expected {n}")
+
+    def run(chunk):
+        start, stop = chunk
+        vectorized(*[arg[start:stop] for arg in args], out=view[start:stop])
+
+    with ThreadPoolExecutor(workers) as pool:
+        list(pool.map(run, chunks(n, workers, chunk_size)))
+    return out
+
+
+def parallel_reduce(session, name: str, *args, initial=0, map: Optional[str] = None,
+                    workers: Optional[int] = None, chunk_size: Optional[int] = None):
+    """
+    Fold args with the (R, R) -> R function called name in parallel. If map is given
+    the function called map is applied to args first, chunk by chunk, and its results
+    are folded. Every chunk starts from initial, so it has to be the identity of name.
+    """
+    folded = session.fold(name)
+    workers = workers or os.cpu_count() or 1
+    if map is not None:
+        vectorized = session.vectorize(map)
+        args, n = prepare(vectorized, args)
+    elif len(args) == 1:
+        vectorized = None
+        args = [materialize(args[0], folded.ret)]
+        n = len(args[0])
+    else:
+        raise Exception(f"{name} folds a single array, got {len(args)}")
+
+    def run(chunk):
+        start, stop = chunk
+        values = [arg[start:stop] for arg in args]
+        return folded(vectorized(*values) if vectorized is not None else values[0], initial)
+
+    with ThreadPoolExecutor(workers) as pool:
+        partials = list(pool.map(run, chunks(n, workers, chunk_size)))
+    return folded(array.array(TYPECODES[folded.ret], partials), initial)
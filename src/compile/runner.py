@@ -1,51 +1,22 @@
-from src.compile import Compiler
-import llvmlite.binding as llvm
-from ctypes import CFUNCTYPE, c_double, c_int8
-
-
-def run(compiler: Compiler):
-    # All these initializations are required for code generation!
-    llvm.initialize()
-    llvm.initialize_native_target()
-    llvm.initialize_native_asmprinter()  # yes, even this one
-    # llvm.load_library_permanently("/usr/lib/libc.dylib")
-    # llvm.add_symbol("abs", llvm.address_of_symbol("abs"))
+from typing import Optional, Sequence
 
-    def create_execution_engine():
-        """
-        Create an ExecutionEngine suitable for JIT code generation on
-        the host CPU.  The engine is reusable for an arbitrary number of
-        modules.
-        """
-        # Create a target machine representing the host
-        target = llvm.Target.from_default_triple()
-        target_machine = target.create_target_machine()
-        # And an execution engine with an empty backing module
-        backing_mod = llvm.parse_assembly("")
-        engine = llvm.create_mcjit_compiler(backing_mod, target_machine)
-        compiler.compile(target_machine.target_data)
-        return engine, str(compiler.module)
-
-    def compile_ir(engine, llvm_ir):
-        """
-        Compile the LLVM IR string with the given engine.
-        The compiled module object is returned.
-        """
-        # Create a LLVM module object from the IR
-        mod = llvm.parse_assembly(llvm_ir)
-        mod.verify()
-        # Now add the module and make sure it is ready for execution
-        engine.add_module(mod)
-        engine.finalize_object()
-        engine.run_static_constructors()
-        return mod
+from src.compile import Compiler
+from src.compile.cache import ObjectCache
+from src.compile.session import JitSession
+from src.compile.lazy import LazyJit
 
-    engine, llvm_ir = create_execution_engine()
-    mod = compile_ir(engine, llvm_ir)
 
-    # Look up the function pointer (a Python int)
-    func_ptr = engine.get_function_address("main")
+def run(compiler: Compiler, opt_level: Optional[int] = None, dump_ir: Optional[str] = None,
+        cache: Optional[ObjectCache] = None, session: Optional[JitSession] = None, libraries: Sequence[str] = (),
+        lazy: bool = False):
+    if session is None:
+        session = JitSession(compiler.opt_level if opt_level is None else opt_level, cache, libraries)
+    if lazy:
+        # Only main and what it ends up calling are ever compiled
+        cfunc = LazyJit(compiler, session).function("main")
+    else:
+        session.add(compiler, dump_ir)
+        cfunc = session.function("main")
 
     # Run the function via ctypes
-    cfunc = CFUNCTYPE(c_int8)(func_ptr)
     print(cfunc())
@@ -0,0 +1,159 @@
+import array
+from typing import Iterable, Optional, Sequence
+
+import llvmlite.binding as llvm
+
+from src.ast import Extern, Function, Types
+from src.compile.cache import ObjectCache
+from src.compile.compiler import Compiler
+from src.compile.externs import prototype, symbols
+from src.compile.vectorize import Folded, Vectorized, ELEMENTS, TYPECODES
+from src.compile.optimizer import check_opt_level, create_target_machine, optimize, dump_ir as write_ir
+from src.instrument import instrumentation
+
+_initialized = False
+
+
+def initialize():
+    global _initialized
+    if _initialized:
+        return
+    # All these initializations are required for code generation!
+    llvm.initialize()
+    llvm.initialize_native_target()
+    llvm.initialize_native_asmprinter()  # yes, even this one
+    _initialized = True
+
+
+class JitSession:
+    """
+    One MCJIT engine and host target machine shared by every module added to it.
+    Modules can call functions defined by earlier modules through extern declarations.
+    """
+
+    def __init__(self, opt_level: int = 0, cache: Optional[ObjectCache] = None, libraries: Sequence[str] = ()):
+        initialize()
+        for library in libraries:
+            symbols.load_library(library)
+        self.opt_level = check_opt_level(opt_level)
+        self.cache = cache
+        self.target_machine = create_target_machine(opt_level)
+        # An execution engine with an empty backing module, every compiled module is added to it
+        self.engine = llvm.create_mcjit_compiler(llvm.parse_assembly(""), self.target_machine)
+        self.modules = []
+        self.signatures = {}
+        self.vectorized = {}
+        self.folded = {}
+        self.__callables = {}
+
+    @property
+    def target_data(self):
+        return self.target_machine.target_data
+
+    def add(self, compiler: Compiler, dump_ir: Optional[str] = None):
+        compiler.compile(self.target_data)
+        externs = {command.identifier for command in compiler.getTree().commands if isinstance(command, Extern)}
+        functions = [f for f in compiler.getTree().functions if f.name not in externs]
+        # MCJIT aborts the process on symbols it cannot resolve, so check them up front
+        symbols.bind(name for name in externs if name not in self.signatures)
+
+        with instrumentation.phase("assemble"):
+            mod = llvm.parse_assembly(str(compiler.module))
+            mod.verify()
+        key = None
+        cached = None
+        # Trees built in memory have no fingerprint and are never cached
+        fingerprint = None if self.cache is None else compiler.fingerprint()
+        if fingerprint is not None:
+            key = self.cache.key(fingerprint, self.opt_level, self.target_machine.triple,
+                                 llvm.get_host_cpu_name())
+            mod.name = key
+            cached = self.cache.load(key)
+        if dump_ir is not None:
+            write_ir(dump_ir, compiler.module.name, "O0", mod)
+        # Machine code from the cache was already optimized, only the declarations are needed
+        if cached is None:
+            with instrumentation.phase("optimize"):
+                optimize(mod, self.opt_level, self.target_machine)
+            if dump_ir is not None and self.opt_level > 0:
+                write_ir(dump_ir, compiler.module.name, f"O{self.opt_level}", mod)
+
+        return self.add_module(mod, functions, key, cached)
+
+    def add_module(self, mod, signatures=(), cache_key: Optional[str] = None, cached: Optional[bytes] = None):
+        if isinstance(signatures, dict):
+            signatures = signatures.values()
+        for func in signatures:
+            if func.name in self.signatures:
+                raise Exception(f"Function {func.name} is already defined in this session")
+        with instrumentation.phase("finalize") as phase:
+            emitted = None
+            if phase:
+                def emitted(module, buffer):
+                    phase.counters["code_bytes"] = phase.counters.get("code_bytes", 0) + len(buffer)
+                phase.counters["cache_hits"] = int(cached is not None)
+            if cache_key is not None:
+                self.cache.attach(self.engine, cache_key, cached, emitted)
+            elif emitted is not None:
+                self.engine.set_object_cache(emitted)
+            # Now add the module and make sure it is ready for execution
+            self.engine.add_module(mod)
+            self.engine.finalize_object()
+            self.engine.run_static_constructors()
+        self.modules.append(mod)
+        for func in signatures:
+            self.signatures[func.name] = func
+        return mod
+
+    def address(self, name: str):
+        address = self.engine.get_function_address(name)
+        if address == 0:
+            raise Exception(f"Function {name} is not defined in this session")
+        return address
+
+    def function(self, name: str):
+        if name not in self.__callables:
+            if name not in self.signatures:
+                raise Exception(f"Function {name} is not defined in this session")
+            func: Function = self.signatures[name]
+            self.__callables[name] = prototype(func.ret, *[arg.type for arg in func.args])(self.address(name))
+        return self.__callables[name]
+
+    def functions(self):
+        return {name: self.function(name) for name in self.signatures}
+
+    def call_many(self, name: str, calls: Iterable[tuple]):
+        """
+        Call name once per argument tuple and return the results as a list. Scalar
+        signatures go through the vectorized wrapper, so the whole batch is one native call.
+        """
+        func = self.function(name)
+        signature: Function = self.signatures[name]
+        types = [arg.type for arg in signature.args] + [Types.INT if signature.ret is None else signature.ret]
+        calls = list(calls)
+        if not calls or not signature.args or any(ty not in ELEMENTS for ty in types):
+            return [func(*args) for args in calls]
+        columns = [array.array(TYPECODES[ty], column) for ty, column in zip(types, zip(*calls))]
+        results = self.vectorize(name)(*columns)
+        results = results.tolist()
+        return [bool(r) for r in results] if types[-1] == Types.BOOL else results
+
+    def vectorize(self, name: str):
+        """
+        The function called name applied element-wise over arrays, see Vectorized.
+        """
+        if name not in self.vectorized:
+            if name not in self.signatures:
+                raise Exception(f"Function {name} is not defined in this session")
+            self.vectorized[name] = Vectorized(self, self.signatures[name])
+        return self.vectorized[name]
+
+    def fold(self, name: str):
+        """
+        The function called name folded over an array, see Folded.
+        """
+        if name not in self.folded:
+            if name not in self.signatures:
+                raise Exception(f"Function {name} is not defined in this session")
+            self.folded[name] = Folded(self, self.signatures[name])
+        return self.folded[name]
@@ -0,0 +1,214 @@
+import array
+from ctypes import CFUNCTYPE, addressof, c_double, c_int32, c_int64, c_uint8, c_void_p, sizeof
+
+import llvmlite.binding as llvm
+from llvmlite import ir
+
+from src.ast import Function, Types
+from src.compile.optimizer import optimize
+
+try:
+    import numpy
+except ImportError:
+    numpy = None
+
+# How one element of each type is laid out in a buffer, bools take a whole byte
+ELEMENTS = {Types.INT: ir.IntType(32), Types.FLOAT: ir.DoubleType(), Types.BOOL: ir.IntType(8)}
+SCALARS = {Types.INT: ir.IntType(32), Types.FLOAT: ir.DoubleType(), Types.BOOL: ir.IntType(1)}
+CTYPES = {Types.INT: c_int32, Types.FLOAT: c_double, Types.BOOL: c_uint8}
+DTYPES = {Types.INT: "int32", Types.FLOAT: "float64", Types.BOOL: "bool"}
+TYPECODES = {Types.INT: "i", Types.FLOAT: "d", Types.BOOL: "B"}
+FORMATS = {Types.INT: {"i", "@i"}, Types.FLOAT: {"d", "@d"}, Types.BOOL: {"?", "B", "b"}}
+
+index = ir.IntType(64)
+
+
+def wrapper_name(name: str):
+    return f"{name}__vec"
+
+
+def fold_name(name: str):
+    return f"{name}__fold"
+
+
+def element_types(func: Function):
+    ret = Types.INT if func.ret is None else func.ret
+    types = [arg.type for arg in func.args] + [ret]
+    for ty in types:
+        if ty not in ELEMENTS:
+            raise Exception(f"Cannot vectorize {func.name}, {ty} values cannot be stored in an array")
+    return types[:-1], ret
+
+
+def build_wrapper(func: Function):
+    """
+    Emit void name__vec(T1* a1, ..., R* out, i64 n) which calls func once per index
+    and stores the results in out. func itself is only declared, the JIT resolves it.
+    """
+    args, ret = element_types(func)
+    module = ir.Module(name=wrapper_name(func.name))
+    callee = ir.Function(module, ir.FunctionType(SCALARS[ret], [SCALARS[ty] for ty in args]), func.name)
+    params = [ELEMENTS[ty].as_pointer() for ty in args] + [ELEMENTS[ret].as_pointer(), index]
+    wrapper = ir.Function(module, ir.FunctionType(ir.VoidType(), params), wrapper_name(func.name))
+    *inputs, out, n = wrapper.args
+    for param in inputs + [out]:
+        param.add_attribute("noalias")
+
+    entry = wrapper.append_basic_block("entry")
+    header = wrapper.append_basic_block("header")
+    body = wrapper.append_basic_block("body")
+    done = wrapper.append_basic_block("done")
+    builder = ir.IRBuilder(entry)
+    builder.branch(header)
+
+    builder.position_at_end(header)
+    i = builder.phi(index, "i")
+    i.add_incoming(ir.Constant(index, 0), entry)
+    builder.cbranch(builder.icmp_signed("<", i, n), body, done)
+
+    builder.position_at_end(body)
+    values = []
+    for ptr, ty in zip(inputs, args):
+        value = builder.load(builder.gep(ptr, [i]))
+        values.append(builder.icmp_unsigned("!=", value, ir.Constant(ELEMENTS[ty], 0)) if ty == Types.BOOL else value)
+    result = builder.call(callee, values)
+    if ret == Types.BOOL:
+        result = builder.zext(result, ELEMENTS[ret])
+    builder.store(result, builder.gep(out, [i]))
+    i.add_incoming(builder.add(i, ir.Constant(index, 1)), body)
+    builder.branch(header)
+
+    builder.position_at_end(done)
+    builder.ret_void()
+    return module
+
+
+def build_fold(func: Function):
+    """
+    Emit R name__fold(R* values, i64 n, R acc) which folds values into acc with
+    acc = func(acc, value), func has to be of the form (R, R) -> R.
+    """
+    args, ret = element_types(func)
+    if ret == Types.BOOL or args != [ret, ret]:
+        raise Exception(f"Cannot fold with {func.name}, it has to take two {ret} and return one")
+    ty = SCALARS[ret]
+    module = ir.Module(name=fold_name(func.name))
+    callee = ir.Function(module, ir.FunctionType(ty, [ty, ty]), func.name)
+    wrapper = ir.Function(module, ir.FunctionType(ty, [ty.as_pointer(), index, ty]), fold_name(func.name))
+    values, n, initial = wrapper.args
+
+    entry = wrapper.append_basic_block("entry")
+    header = wrapper.append_basic_block("header")
+    body = wrapper.append_basic_block("body")
+    done = wrapper.append_basic_block("done")
+    builder = ir.IRBuilder(entry)
+    builder.branch(header)
+
+    builder.position_at_end(header)
+    i = builder.phi(index, "i")
+    acc = builder.phi(ty, "acc")
+    i.add_incoming(ir.Constant(index, 0), entry)
+    acc.add_incoming(initial, entry)
+    builder.cbranch(builder.icmp_signed("<", i, n), body, done)
+
+    builder.position_at_end(body)
+    result = builder.call(callee, [acc, builder.load(builder.gep(values, [i]))])
+    i.add_incoming(builder.add(i, ir.Constant(index, 1)), body)
+    acc.add_incoming(result, body)
+    builder.branch(header)
+
+    builder.position_at_end(done)
+    builder.ret(acc)
+    return module
+
+
+def allocate(n: int, ty: Types):
+    if numpy is not None:
+        return numpy.empty(n, DTYPES[ty])
+    return array.array(TYPECODES[ty], bytes(n * sizeof(CTYPES[ty])))
+
+
+def buffer(obj, ty: Types, writable: bool = False):
+    """
+    Returns (address, length, owner) for obj, owner has to outlive the call. Inputs
+    that are not already contiguous ty are copied once, which never changes a value:
+    arrays and buffers only take safe casts (int to double, bool to int) and plain
+    sequences must convert exactly, anything else raises.
+    """
+    if numpy is not None and (isinstance(obj, numpy.ndarray) or not writable):
+        dtype = DTYPES[ty]
+        if writable and (obj.dtype != dtype or not obj.flags.c_contiguous or not obj.flags.writeable):
+            raise Exception(f"Output must be a writable contiguous {dtype} array")
+        source = numpy.asarray(obj)
+        if not numpy.can_cast(source.dtype, dtype, "safe"):
+            # numpy picks int64 for a list of Python ints, so sequences are checked by value
+            if isinstance(obj, numpy.ndarray) or not isinstance(obj, (list, tuple)) \
+                    or not numpy.array_equal(source.astype(dtype), source):
+                raise Exception(f"Cannot pass {source.dtype} as {dtype} without changing values")
+        obj = numpy.ascontiguousarray(source, dtype)
+        return obj.ctypes.data, obj.size, obj
+    view = memoryview(obj)
+    if view.format not in FORMATS[ty] or not view.c_contiguous:
+        raise Exception(f"Expected a contiguous buffer of {DTYPES[ty]}, got format {view.format!r}")
+    if writable and view.readonly:
+        raise Exception("Output buffer is read-only")
+    if view.nbytes == 0:
+        return None, 0, view
+    ctype = CTYPES[ty] * (view.nbytes // view.itemsize)
+    owner = ctype.from_buffer_copy(view) if view.readonly else ctype.from_buffer(view)
+    return addressof(owner), len(owner), owner
+
+
+class Vectorized:
+    """
+    A compiled function applied element-wise over whole buffers in one native call.
+    Arguments can be numpy arrays or any contiguous buffer of the right element type,
+    which are passed without copying. Results are numpy arrays when numpy is
+    installed and array.array otherwise.
+    """
+
+    def __init__(self, session, func: Function):
+        self.name = func.name
+        self.args, self.ret = element_types(func)
+        mod = llvm.parse_assembly(str(build_wrapper(func)))
+        mod.verify()
+        optimize(mod, session.opt_level, session.target_machine)
+        session.add_module(mod)
+        prototype = CFUNCTYPE(None, *[c_void_p] * (len(self.args) + 1), c_int64)
+        self.__function = prototype(session.address(wrapper_name(func.name)))
+
+    def __call__(self, *args, out=None):
+        if len(args) != len(self.args) or not args:
+            raise Exception(f"{self.name}__vec takes {len(self.args)} arrays, got {len(args)}")
+        # Keep the converted buffers alive until the call returns
+        buffers = [buffer(arg, ty) for arg, ty in zip(args, self.args)]
+        n = buffers[0][1]
+        if any(length != n for _, length, _ in buffers):
+            raise Exception(f"Arguments of {self.name}__vec have different lengths")
+        if out is None:
+            out = allocate(n, self.ret)
+        result, length, _ = buffer(out, self.ret, writable=True)
+        if length != n:
+            raise Exception(f"Output of {self.name}__vec has {length} elements, expected {n}")
+        self.__function(*[address for address, _, _ in buffers], result, n)
+        return out
+
+
+class Folded:
+    """
+    A compiled (R, R) -> R function folded over a whole buffer in one native call.
+    """
+
+    def __init__(self, session, func: Function):
+        self.name = func.name
+        self.ret = element_types(func)[1]
+        mod = llvm.parse_assembly(str(build_fold(func)))
+        mod.verify()
+        optimize(mod, session.opt_level, session.target_machine)
+        session.add_module(mod)
+        prototype = CFUNCTYPE(CTYPES[self.ret], c_void_p, c_int64, CTYPES[self.ret])
+        self.__function = prototype(session.address(fold_name(func.name)))
+
+    def __call__(self, values, initial):
+        address, n, _ = buffer(values, self.ret)
+        return self.__function(address, n, initial)
@@ -0,0 +1,35 @@
+import os
+from typing import Dict, List, Optional
+
+from src.lexer import Lexer
+from src.parser import Parser
+
+SUFFIX = ".ez"
+
+
+class FileImporter:
+    """
+    Resolves `import name` to name.ez in the importing file's directory or the
+    search path and hands the parser the signatures of its top level functions.
+    Declarations already scanned elsewhere, e.g. by the build driver, can be passed
+    in as a {path: declarations} map so those files are not lexed again.
+    """
+
+    def __init__(self, directory: str, search_path: List[str] = (), declarations: Optional[Dict] = None):
+        self.search_path = [directory, *search_path]
+        self.__declarations = {} if declarations is None else declarations
+
+    def find(self, name: str):
+        for directory in self.search_path:
+            path = os.path.join(directory, name + SUFFIX)
+            if os.path.isfile(path):
+                return os.path.abspath(path)
+        raise Exception(f"Cannot find module {name} in {self.search_path}")
+
+    def declarations(self, path: str):
+        if path not in self.__declarations:
+            self.__declarations[path] = Parser(Lexer.open(path)).parseDeclarations()
+        return self.__declarations[path]
+
+    def __call__(self, name: str):
+        return self.declarations(self.find(name))[0]
@@ -0,0 +1,115 @@
+from time import perf_counter
+from typing import Callable, Dict
+
+
+class Phase:
+    __slots__ = ("instrumentation", "name", "counters", "start")
+
+    def __init__(self, instrumentation, name: str):
+        self.instrumentation = instrumentation
+        self.name = name
+        self.counters = {}
+        self.start = 0.0
+
+    def __enter__(self):
+        self.start = perf_counter()
+        return self
+
+    def __exit__(self, *exc):
+        self.instrumentation.record(self.name, perf_counter() - self.start, self.counters)
+        return False
+
+
+class NullPhase:
+    """
+    Handed out while instrumentation is disabled. It is falsy, so callers can skip
+    computing counters with `if phase:`.
+    """
+    __slots__ = ()
+
+    @property
+    def counters(self):
+        return {}
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        return False
+
+    def __bool__(self):
+        return False
+
+
+NULL_PHASE = NullPhase()
+
+
+class Instrumentation:
+    """
+    Wall time and counters for the compiler phases. Disabled it costs one attribute
+    check per phase. Hooks are called as hook(phase, seconds, counters) after every
+    recorded phase, e.g. to forward them to a metrics system.
+    """
+
+    def __init__(self):
+        self.enabled = False
+        self.hooks = []
+        self.phases: Dict[str, Dict] = {}
+
+    def enable(self, *hooks: Callable):
+        self.hooks.extend(hooks)
+        self.enabled = True
+
+    def disable(self):
+        self.enabled = False
+
+    def reset(self):
+        self.phases = {}
+
+    def add_hook(self, hook: Callable):
+        self.hooks.append(hook)
+
+    def remove_hook(self, hook: Callable):
+        self.hooks.remove(hook)
+
+    def phase(self, name: str):
+        return Phase(self, name) if self.enabled else NULL_PHASE
+
+    def record(self, name: str, seconds: float, counters: Dict = None):
+        counters = counters or {}
+        entry = self.phases.setdefault(name, {"calls": 0, "seconds": 0.0, "counters": {}})
+        entry["calls"] += 1
+        entry["seconds"] += seconds
+        for counter, value in counters.items():
+            entry["counters"][counter] = entry["counters"].get(counter, 0) + value
+        for hook in self.hooks:
+            hook(name, seconds, counters)
+
+    def report(self):
+        return {name: {"calls": entry["calls"], "seconds": entry["seconds"], "counters": dict(entry["counters"])}
+                for name, entry in self.phases.items()}
+
+
+instrumentation = Instrumentation()
+
+
+class TimedLexer:
+    """
+    Wraps a lexer while instrumentation is enabled to time tokenization separately
+    from the parser pulling the tokens.
+    """
+
+    def __init__(self, lexer):
+        self.lexer = lexer
+        self.seconds = 0.0
+        self.tokens = 0
+
+    def nextToken(self):
+        start = perf_counter()
+        token = self.lexer.nextToken()
+        self.seconds += perf_counter() - start
+        self.tokens += 1
+        return token
+
+    def __getattr__(self, name):
+        return getattr(self.lexer, name)
@@ -0,0 +1,259 @@
+import math
+import threading
+from typing import Dict, Optional, Union
+
+from src.ast import Scope, Function, FunctionCall, SetVariable, Return, ExpressionType, Extern, Types, Variable
+from src.parser import Parser
+from src.passes import fold_constants, resolve_types, eliminate_dead_code
+from src.passes.fold import INT_MIN, wrap
+from src.instrument import instrumentation
+
+
+def convert(value, source: Types, target: Types):
+    """
+    The same conversions the compiler emits between int, double and bool.
+    """
+    if source == target or source is None or target is None or Types.POINTER in (source, target):
+        return value
+    if target == Types.FLOAT:
+        return float(value)
+    elif target == Types.INT:
+        return wrap(int(value))
+    return value != 0
+
+
+def arithmetic(op: ExpressionType, ty: Types, a, b):
+    if ty != Types.FLOAT:
+        if op == ExpressionType.ADD:
+            return wrap(a + b)
+        elif op == ExpressionType.MINUS:
+            return wrap(a - b)
+        elif op == ExpressionType.MULTIPLY:
+            return wrap(a * b)
+        # Native code traps on both of these
+        elif b == 0 or (a == INT_MIN and b == -1):
+            raise Exception(f"Integer division {a} / {b} is undefined")
+        quotient = abs(a) // abs(b)
+        return quotient if (a < 0) == (b < 0) else -quotient
+    if op == ExpressionType.ADD:
+        return a + b
+    elif op == ExpressionType.MINUS:
+        return a - b
+    elif op == ExpressionType.MULTIPLY:
+        return a * b
+    elif b != 0:
+        return a / b
+    # IEEE division by zero instead of ZeroDivisionError
+    if a == 0 or math.isnan(a):
+        return math.nan
+    return math.copysign(math.inf, a) * math.copysign(1.0, b)
+
+
+def ret_type(func: Function):
+    return Types.INT if func.ret is None else func.ret
+
+
+def native_safe(func: Function):
+    # Interpreter pointers are (variables, name) pairs, they cannot cross into native code
+    return all(ty != Types.POINTER for ty in [arg.type for arg in func.args] + [ret_type(func)])
+
+
+class Frame:
+    __slots__ = ("func", "commands", "variables", "pc", "command", "work", "results")
+
+    def __init__(self, func: Function, variables: Dict):
+        self.func = func
+        self.commands = func.commands
+        self.variables = variables
+        self.pc = 0
+        self.command = None
+        self.work = []
+        self.results = []
+
+
+class Interpreter:
+    """
+    Runs a program by walking its tree, which starts immediately, while counting calls
+    per function. A function called threshold times is compiled to native code and
+    every later call to it, including ones from the middle of the current run, goes to
+    the native version instead. threshold=None never compiles anything.
+    """
+
+    def __init__(self, name: str, parser: Union[Parser, Scope], threshold: Optional[int] = 1000,
+                 opt_level: int = 0, session=None):
+        self.name = name
+        self.threshold = threshold
+        self.opt_level = opt_level
+        self.session = session
+        if isinstance(parser, Scope):
+            self.root = parser
+        else:
+            parser.parse()
+            self.root = parser.getTree()
+        # The same passes as the compiler, so a promoted function sees the same tree
+        with instrumentation.phase("fold"):
+            fold_constants(self.root)
+        with instrumentation.phase("types"):
+            resolve_types(self.root)
+        with instrumentation.phase("dead_code"):
+            eliminate_dead_code(self.root)
+        self.externs = {command.identifier for command in self.root.commands if isinstance(command, Extern)}
+        self.functions = {func.name: func for func in self.root.functions}
+        self.counters = {name: 0 for name in self.functions if name not in self.externs}
+        self.native = {}
+        self.__jit = None
+        self.__lock = threading.Lock()
+
+    @property
+    def promoted(self):
+        """
+        Every function running natively, callees the JIT compiled for a promoted function included.
+        """
+        compiled = set() if self.__jit is None else set(self.__jit.compiled)
+        return sorted((set(self.native) | compiled) - self.externs)
+
+    def run(self):
+        return self.call("main")
+
+    def call(self, name: str, *args):
+        if name not in self.functions:
+            raise Exception(f"Function {name} is not defined in {self.name}")
+        func = self.functions[name]
+        if len(args) != len(func.args):
+            raise Exception(f"{name} takes {len(func.args)} arguments, got {len(args)}")
+        args = [convert(arg, Types.FLOAT if isinstance(arg, float) else Types.INT, param.type)
+                for arg, param in zip(args, func.args)]
+        native = self.__native(name)
+        if native is not None:
+            return native(*args)
+        return self.__execute(func, args)
+
+    def __native(self, name: str):
+        """
+        The native callable for name if it has been promoted or compiled as a callee of
+        a promoted function, counting the call otherwise.
+        """
+        if name in self.native:
+            return self.native[name]
+        func = self.functions[name]
+        if name in self.externs:
+            return self.__extern(func)
+        if not native_safe(func):
+            return None
+        if self.__jit is not None and name in self.__jit.compiled:
+            self.native[name] = self.__jit.compiled[name]
+            return self.native[name]
+        self.counters[name] += 1
+        if self.threshold is None or self.counters[name] < self.threshold:
+            return None
+        return self.__promote(name)
+
+    def __promote(self, name: str):
+        with self.__lock:
+            if self.__jit is None:
+                # The JIT is only imported once something gets hot, short runs never pay for it
+                from src.compile.compiler import Compiler
+                from src.compile.lazy import LazyJit
+                self.__jit = LazyJit(Compiler(self.name, self.root, self.opt_level), self.session)
+            with instrumentation.phase("promote"):
+                self.native[name] = self.__jit.compile(name)
+        return self.native[name]
+
+    def __extern(self, func: Function):
+        from src.compile.externs import prototype, symbols
+        symbols.bind([func.name])
+        self.native[func.name] = prototype(func.ret, *[arg.type for arg in func.args])(symbols.resolve(func.name))
+        return self.native[func.name]
+
+    def __execute(self, func: Function, args):
+        """
+        Runs func with an explicit stack of frames, calls between interpreted functions
+        never recurse in Python.
+        """
+        frames = [Frame(func, {arg.name: value for arg, value in zip(func.args, args)})]
+        while True:
+            frame = frames[-1]
+            if frame.command is None:
+                if frame.pc >= len(frame.commands):
+                    value = convert(0, Types.INT, ret_type(frame.func))
+                    frames.pop()
+                    if not frames:
+                        return value
+                    frames[-1].results.append(value)
+                    continue
+                frame.command = frame.commands[frame.pc]
+                frame.pc += 1
+                root = frame.command if isinstance(frame.command, FunctionCall) else frame.command.value
+                frame.work.append((root, False))
+
+            if not self.__evaluate(frame, frames):
+                # A call pushed a new frame, resume this one once it returns
+                continue
+
+            command = frame.command
+            value = frame.results.pop()
+            frame.command = None
+            if isinstance(command, SetVariable):
+                value = convert(value, command.value.value_type, command.value_type)
+                if command.deref:
+                    variables, name = frame.variables[command.name]
+                    variables[name] = value
+                else:
+                    frame.variables[command.name] = value
+            elif isinstance(command, Return):
+                value = convert(value, command.value.value_type, command.value_type)
+                frames.pop()
+                if not frames:
+                    return value
+                frames[-1].results.append(value)
+
+    def __evaluate(self, frame: Frame, frames):
+        """
+        Post-order over frame's pending expression. Returns False when it stopped to
+        enter an interpreted call.
+        """
+        work, results, variables = frame.work, frame.results, frame.variables
+        while work:
+            node, expanded = work.pop()
+            if isinstance(node, FunctionCall):
+                if not expanded:
+                    work.append((node, True))
+                    work += [(arg, False) for arg in reversed(node.args)]
+                    continue
+                callee = self.functions[node.name]
+                args = results[len(results) - len(node.args):]
+                del results[len(results) - len(node.args):]
+                args = [convert(value, arg.value_type, param.type)
+                        for value, arg, param in zip(args, node.args, callee.args)]
+                native = self.__native(node.name)
+                if native is not None:
+                    results.append(native(*args))
+                    continue
+                frames.append(Frame(callee, {arg.name: value for arg, value in zip(callee.args, args)}))
+                return False
+            elif node.type == ExpressionType.VALUE:
+                v = node.value
+                if isinstance(v, FunctionCall):
+                    work.append((v, False))
+                elif isinstance(v, Variable):
+                    results.append(variables[v.name])
+                else:
+                    results.append(v)
+            elif node.type == ExpressionType.REFERENCE:
+                results.append((variables, node.value.name))
+            elif node.type == ExpressionType.DEREFERENCE:
+                target, name = variables[node.value.name]
+                results.append(target[name])
+            elif not expanded:
+                work.append((node, True))
+                if node.type != ExpressionType.NEGATE:
+                    work.append((node.right, False))
+                work.append((node.left, False))
+            elif node.type == ExpressionType.NEGATE:
+                operand = convert(results.pop(), node.left.value_type, node.value_type)
+                results.append(-operand if node.value_type == Types.FLOAT else wrap(-operand))
+            else:
+                right = convert(results.pop(), node.right.value_type, node.value_type)
+                left = convert(results.pop(), node.left.value_type, node.value_type)
+                results.append(arithmetic(node.type, node.value_type, left, right))
+        return True
@@ -1,58 +1,124 @@
-from collections import deque
+import hashlib
+import os
+import re
+import sys
 
 from src.token import Token
 
 
 class Lexer:
-    def __init__(self, text: str):
+    KEYWORDS = {"fun": Token.FUN, "extern": Token.EXTERN, "end": Token.END, "return": Token.RETURN,
+                "import": Token.IMPORT}
+    SPECIAL_CHARS = {"(": Token.OPEN_PARENTH, ")": Token.CLOSE_PARENTH, ",": Token.COMMA,
+                     "+": Token.ADD, "-": Token.SUBTRACT, "*": Token.MULTIPLY, "/": Token.DIVIDE,
+                     "=": Token.EQUALS, ":": Token.COLON, "&": Token.REF}
+
+    # Leading blanks (but not newlines) are skipped, then exactly one of the groups matches.
+    PATTERN = re.compile(r"[^\S\n]*(?:(\n)|(\d+\.\d+)|(\w+)|([(),+\-*/=:&]))")
+    BLANK = re.compile(r"[^\S\n]*")
+    CHUNK_SIZE = 1 << 16
+
+    def __init__(self, text: str = "", source=None):
         self.__text = text
-        self.__que = deque(text)
+        self.__source = source
+        self.__owned = False
+        self.__hash = None if source is None else hashlib.sha256()
+        self.__pos = 0
         self.__identifier = ""
-        self.__special_chars = {"(": Token.OPEN_PARENTH, ")": Token.CLOSE_PARENTH, ",": Token.COMMA,
-                                "+": Token.ADD, "-": Token.SUBTRACT, "*": Token.MULTIPLY, "/": Token.DIVIDE,
-                                "=": Token.EQUALS, ":": Token.COLON, "&": Token.REF}
+        self.__line = 1
+        self.__line_start = 0
+        self.__token_line = 1
+        self.__token_column = 1
+
+    @classmethod
+    def open(cls, source):
+        """
+        Lex from a path, a text or binary file object or an mmap without reading all
+        of it into memory, only about CHUNK_SIZE bytes of source are held at a time.
+        """
+        if isinstance(source, (str, bytes, os.PathLike)):
+            lexer = cls(source=open(source, "rb"))
+            lexer.__owned = True
+            return lexer
+        return cls(source=source)
+
+    def tokens(self):
+        """
+        Yields (token, identifier) pairs up to and excluding EOF.
+        """
+        while (token := self.nextToken()) != Token.EOF:
+            yield token, self.__identifier
+
+    def __refill(self):
+        if self.__source is None:
+            return False
+        # Chunks always end after a newline so no token is ever split between two of them
+        chunk = self.__source.read(self.CHUNK_SIZE)
+        if chunk:
+            chunk += self.__source.readline()
+        if not chunk:
+            if self.__owned:
+                self.__source.close()
+            self.__source = None
+            return False
+        if isinstance(chunk, str):
+            self.__hash.update(chunk.encode("utf-8"))
+        else:
+            self.__hash.update(chunk)
+            chunk = chunk.decode("utf-8")
+        self.__text = chunk
+        self.__pos = 0
+        self.__line_start = 0
+        return True
 
     def lastIdentifier(self):
         return self.__identifier
 
+    def lastPosition(self):
+        return self.__token_line, self.__token_column
+
+    def sourceHash(self):
+        if self.__hash is None:
+            return hashlib.sha256(self.__text.encode("utf-8")).hexdigest()
+        if self.__source is not None:
+            raise Exception("The source hash of a stream is only known once it has been read to the end")
+        return self.__hash.hexdigest()
+
     def nextToken(self):
-        if len(self.__que) == 0:
-            return Token.EOF
-
-        c: str = self.__que.popleft()
-        while c.isspace() and len(c) > 0:
-            if c == "\n":
-                self.__identifier = c
-                return Token.EOL
-            if len(self.__que) == 0:
+        text = self.__text
+        match = self.PATTERN.match(text, self.__pos)
+        if match is None:
+            self.__pos = self.BLANK.match(text, self.__pos).end()
+            if self.__pos >= len(text):
+                if self.__refill():
+                    return self.nextToken()
+                self.__token_line, self.__token_column = self.__line, self.__pos - self.__line_start + 1
                 return Token.EOF
-            c = self.__que.popleft()
+            column = self.__pos - self.__line_start + 1
+            raise Exception(f"Unexpected character {text[self.__pos]!r} at line {self.__line}, column {column}")
+
+        group = match.lastindex
+        start = match.start(group)
+        self.__pos = match.end()
+        self.__token_line, self.__token_column = self.__line, start - self.__line_start + 1
 
-        if c in self.__special_chars:
+        if group == 1:
+            self.__identifier = "\n"
+            self.__line += 1
+            self.__line_start = self.__pos
+            return Token.EOL
+        elif group == 4:
+            c = match.group(4)
             self.__identifier = c
-            return self.__special_chars[c]
-        identifier = ""
-        while c.isalnum():
-            if c in self.__special_chars:
-                self.__identifier = c
-                return self.__special_chars[c]
-            identifier += c
-            if len(self.__que) == 0:
-                break
-            c = self.__que.popleft()
-        else:
-            self.__que.appendleft(c)
+            return self.SPECIAL_CHARS[c]
+        elif group == 2:
+            self.__identifier = match.group(2)
+            return Token.NUMBER
 
+        identifier = sys.intern(match.group(3))
         self.__identifier = identifier
-        if identifier == "fun":
-            return Token.FUN
-        elif identifier == "extern":
-            return Token.EXTERN
-        elif identifier == "end":
-            return Token.END
-        elif identifier == "return":
-            return Token.RETURN
-        elif identifier.isnumeric():
+        if identifier in self.KEYWORDS:
+            return self.KEYWORDS[identifier]
+        elif identifier.isdecimal():
             return Token.NUMBER
-        else:
-            return Token.IDENTIFIER
+        return Token.IDENTIFIER
@@ -1,13 +1,15 @@
-from src import Lexer, Token
+from src import Lexer, Token, SymbolTable
 from collections import deque
+from time import perf_counter
 
 from src.ast import *
+from src.instrument import instrumentation, TimedLexer
 
 PRECEDENCE = {
-    "+": 1,
-    "-": 2,
-    "*": 3,
-    "/": 4
+    Token.ADD: 1,
+    Token.SUBTRACT: 1,
+    Token.MULTIPLY: 2,
+    Token.DIVIDE: 2
 }
 
 
@@ -31,17 +33,23 @@ class PeakStack:
 
 
 class Parser:
-    OPERATORS = {ExpressionType.ADD: 2, ExpressionType.MINUS: 2, ExpressionType.MULTIPLY: 1, ExpressionType.DIVIDE: 1}
+    GROUP = 0
+    CALL = 1
+    NEGATE = 2
+    BINARY = 3
     OPERATOR_STRS = {Token.ADD: "+", Token.SUBTRACT: "-", Token.MULTIPLY: "*", Token.DIVIDE: "/"}
     OPERATOR_EXPS = {Token.ADD: ExpressionType.ADD, Token.SUBTRACT: ExpressionType.MINUS,
                      Token.MULTIPLY: ExpressionType.MULTIPLY, Token.DIVIDE: ExpressionType.DIVIDE}
 
-    def __init__(self, lexer: Lexer):
+    def __init__(self, lexer: Lexer, importer=None):
         self.__lexer = lexer
+        self.__importer = importer
         self.__last_token = self.__lexer.nextToken()
         self.__root_commands = []
         self.__root = Scope(True)
         self.__scope_stack = PeakStack([self.__root])
+        self.__symbols = SymbolTable()
+        self.__symbols.push(self.__root)
 
     def __last_identifier(self):
         return self.__lexer.lastIdentifier()
@@ -52,21 +60,38 @@ class Parser:
     def getTree(self):
         return self.__root
 
+    def sourceHash(self):
+        return self.__lexer.sourceHash()
+
     def parse(self):
+        if not instrumentation.enabled:
+            return self.__parse()
+        lexer = self.__lexer = TimedLexer(self.__lexer)
+        start = perf_counter()
+        self.__parse()
+        seconds = perf_counter() - start
+        self.__lexer = lexer.lexer
+        instrumentation.record("lex", lexer.seconds, {"tokens": lexer.tokens})
+        instrumentation.record("parse", seconds - lexer.seconds, {"ast_nodes": count(self.__root)})
+
+    def __parse(self):
         deref = False
         while self.__last_token != Token.EOF:
             if self.__last_token == Token.FUN:
                 self.__parse_function()
                 self.__next()
             elif self.__last_token == Token.IDENTIFIER and self.__funInScope(self.__last_identifier()):
-                func = self.__parse_function_call(self.__last_identifier())
+                func = self.__parse_function_call()
                 self.__scope_stack.top.commands.append(func)
             elif self.__last_token == Token.IDENTIFIER and not self.__funInScope(name := self.__last_identifier()):
                 self.__parse_assignment(name, deref)
+                deref = False
             elif self.__last_token == Token.RETURN:
                 self.__parse_return()
             elif self.__last_token == Token.EXTERN:
                 self.__parse_extern()
+            elif self.__last_token == Token.IMPORT:
+                self.__parse_import()
             elif self.__last_token == Token.END:
                 self.__parse_end()
                 self.__next()
@@ -76,6 +101,37 @@ class Parser:
             else:
                 self.__next()
 
+    def parseDeclarations(self):
+        """
+        Only scan for the signatures of the top level functions and the imports,
+        without building function bodies.
+        """
+        functions = []
+        imports = []
+        depth = 0
+        while self.__last_token != Token.EOF:
+            if self.__last_token == Token.FUN and depth == 0:
+                self.__next()
+                if self.__last_token != Token.IDENTIFIER:
+                    raise Exception()
+                name = self.__last_identifier()
+                self.__next()
+                if self.__last_token != Token.OPEN_PARENTH:
+                    raise Exception()
+                args = self.__parse_type_set()
+                self.__next()
+                ret = self.__get_return()
+                functions.append(Function(name, args, ret))
+                depth += 1
+            elif self.__last_token == Token.FUN:
+                depth += 1
+            elif self.__last_token == Token.END:
+                depth -= 1
+            elif self.__last_token == Token.IMPORT and depth == 0:
+                imports.append(self.__parse_import_name())
+            self.__next()
+        return functions, imports
+
     def __parse_type_set(self):
         args = []
         self.__next()
@@ -110,9 +166,9 @@ class Parser:
         args = self.__parse_type_set()
         self.__next()
         ret = self.__get_return()
-        self.__next()
         func = Function(name, args, ret)
         self.__scope_stack.push(func)
+        self.__symbols.push(func)
 
     def __get_return(self):
         ret = None
@@ -121,33 +177,25 @@ class Parser:
             if self.__last_token != Token.IDENTIFIER:
                 raise Exception
             ret = Types.from_identifier(self.__last_identifier())
+            self.__next()
         return ret
 
     def __parse_return(self):
         self.__next()
-        if self.__last_token != Token.IDENTIFIER:
-            raise Exception()
         va = self.parse_value()
         self.__scope_stack.top.commands.append(Return(va))
 
     def __parse_end(self):
         full_scope = self.__scope_stack.pop()
+        self.__symbols.pop()
         if type(full_scope) == Function:
-            self.__scope_stack.top.functions.append(full_scope)
-
-    def __parse_function_call(self, identifier):
-        self.__next()
-        if self.__last_token != Token.OPEN_PARENTH:
-            raise Exception()
+            self.__scope_stack.top.add_function(full_scope)
 
-        self.__next()
-        args = []
-        while self.__last_token != Token.CLOSE_PARENTH:
-            value = self.parse_value()
-            args.append(value)
-            if self.__last_token == Token.COMMA:
-                self.__next()
-        return FunctionCall(identifier, args)
+    def __parse_function_call(self):
+        value = self.parse_value()
+        if value.type != ExpressionType.VALUE or not isinstance(value.value, FunctionCall):
+            raise self.__error("Expected a function call")
+        return value.value
 
     def __parse_extern(self):
         self.__next()
@@ -160,11 +208,28 @@ class Parser:
         args = self.__parse_type_set()
         self.__next()
         ret = self.__get_return()
-        self.__next()
         func = Function(identifier, args, ret)
         extern = Extern(identifier, func)
         self.__root.commands.append(extern)
-        self.__root.functions.append(func)
+        self.__root.add_function(func)
+
+    def __parse_import_name(self):
+        self.__next()
+        if self.__last_token != Token.IDENTIFIER:
+            raise Exception()
+        return self.__last_identifier()
+
+    def __parse_import(self):
+        name = self.__parse_import_name()
+        if self.__importer is None:
+            raise Exception(f"Cannot import {name} without an importer")
+        for func in self.__importer(name):
+            if self.__funInScope(func.name):
+                continue
+            declaration = Function(func.name, [Variable(arg.name, arg.type) for arg in func.args], func.ret)
+            self.__root.commands.append(Extern(func.name, declaration))
+            self.__root.add_function(declaration)
+        self.__next()
 
     def __parse_assignment(self, identifier, deref=False):
         self.__next()
@@ -173,152 +238,134 @@ class Parser:
             self.__next()
             if self.__last_token != Token.IDENTIFIER:
                 raise Exception()
-            iden = self.__last_token
-            ty = Types.from_identifier(iden)
+            ty = Types.from_identifier(self.__last_identifier())
+            if ty is None:
+                raise self.__error(f"Unknown type {self.__last_identifier()}")
+            self.__next()
 
-        elif self.__last_identifier() != "=":
-            raise Exception()
+        if self.__last_token != Token.EQUALS:
+            raise self.__error("Expected =")
         self.__next()
         value = self.parse_value()
         if not self.__varInScope(identifier):
-            if ty is None:
-                ty = self.__typeOf(value)
+            # Without a declared type the type pass gives it the type of the value
             variable = Variable(identifier, ty)
-            self.__scope_stack.top.variables.append(variable)
+            self.__scope_stack.top.add_variable(variable)
         set_var = SetVariable(identifier, value, deref)
         self.__scope_stack.top.commands.append(set_var)
 
-    def __typeOf(self, v: Value):
-        if v.type in {ExpressionType.VALUE, ExpressionType.REFERENCE, ExpressionType.DEREFERENCE}:
-            if isinstance(v.value, int):
-                return Types.INT
-            elif isinstance(v.value, float):
-                return Types.FLOAT
-            elif isinstance(v.value, Variable):
-                return v.value.type
-        else:
-            if ty := self.__typeOf(v.left) is not None:
-                return ty
-            if ty := self.__typeOf(v.right) is not None:
-                return ty
-        return None
+    def __error(self, message):
+        line, column = self.__lexer.lastPosition()
+        return Exception(f"{message} at line {line}, column {column}")
 
     def parse_value(self):
-        tree = Value(None, ExpressionType.PLACEHOLDER)
-        negate = False
-        ref = False
-        deref = False
-        op_stack = PeakStack([tree])
-        while self.__last_token != Token.CLOSE_PARENTH and self.__last_token != Token.COMMA and self.__last_token != Token.EOL:
-            if self.__last_token == Token.NUMBER:
-                integer = int(self.__last_identifier())
-                if negate:
-                    integer *= -1
-                    negate = False
-                val = Value(integer, ExpressionType.VALUE)
-                self.__add_value(op_stack, val)
-            elif self.__last_token == Token.OPEN_PARENTH:
-                self.__next()
-                val = self.parse_value()
-                self.__add_value(op_stack, val)
-            elif self.__last_token == Token.IDENTIFIER and self.__funInScope(iden := self.__last_identifier()):
-                value = self.__parse_function_call(iden)
-                val = None
-                if negate:
-                    val = Value("*", ExpressionType.MULTIPLY)
-                    val.left = Value(-1, ExpressionType.VALUE)
-                    val.right = Value(value, ExpressionType.VALUE)
-                    negate = False
+        """
+        Precedence climbing over explicit operand and operator stacks, so neither
+        nesting depth nor expression length grows the Python stack. Stops, without
+        consuming it, at the first token that can't continue the expression: a
+        newline, or a comma or closing parenthesis that belongs to the caller.
+        """
+        operands = []
+        # Entries are (GROUP, None), (CALL, (name, first operand index)), (NEGATE, None) or (BINARY, token)
+        operators = []
+        expect_operand = True
+        prefix = ExpressionType.VALUE
+        while True:
+            token = self.__last_token
+            if expect_operand:
+                if token == Token.NUMBER:
+                    literal = self.__last_identifier()
+                    operands.append(Value(float(literal) if "." in literal else int(literal), ExpressionType.VALUE))
+                    expect_operand = False
+                elif token == Token.IDENTIFIER and self.__funInScope(iden := self.__last_identifier()):
+                    self.__next()
+                    if self.__last_token != Token.OPEN_PARENTH:
+                        raise self.__error(f"Expected ( after {iden}")
+                    operators.append((self.CALL, (iden, len(operands))))
+                    self.__next()
+                    if self.__last_token == Token.CLOSE_PARENTH:
+                        self.__reduce_call(operands, operators.pop()[1])
+                        expect_operand = False
+                    else:
+                        continue
+                elif token == Token.IDENTIFIER and self.__varInScope(iden := self.__last_identifier()):
+                    operands.append(Value(self.__getVar(iden), prefix))
+                    prefix = ExpressionType.VALUE
+                    expect_operand = False
+                elif token == Token.IDENTIFIER:
+                    raise self.__error(f"Unknown identifier {self.__last_identifier()}")
+                elif token == Token.OPEN_PARENTH:
+                    operators.append((self.GROUP, None))
+                elif token == Token.SUBTRACT:
+                    operators.append((self.NEGATE, None))
+                elif token == Token.REF:
+                    prefix = ExpressionType.REFERENCE
+                elif token == Token.MULTIPLY:
+                    prefix = ExpressionType.DEREFERENCE
                 else:
-                    val = Value(value, ExpressionType.VALUE)
-                self.__add_value(op_stack, val)
-            elif self.__last_token == Token.IDENTIFIER and self.__varInScope(iden := self.__last_identifier()):
-                variable = self.__getVar(iden)
-                val = None
-                if negate:
-                    val = Value("*", ExpressionType.MULTIPLY)
-                    val.left = Value(-1, ExpressionType.VALUE)
-                    val.right = Value(variable, ExpressionType.VALUE)
-                    negate = False
-                elif deref:
-                    val = Value(variable, ExpressionType.DEREFERENCE)
-                    deref = False
-                elif ref:
-                    val = Value(variable, ExpressionType.REFERENCE)
-                    ref = False
+                    raise self.__error(f"Expected a value, got {self.__last_identifier()!r}")
+            elif token in PRECEDENCE:
+                # Everything on the stack that binds at least as tight is complete (left associative)
+                while operators and (operators[-1][0] == self.NEGATE or (
+                        operators[-1][0] == self.BINARY and PRECEDENCE[operators[-1][1]] >= PRECEDENCE[token])):
+                    self.__reduce(operands, operators.pop())
+                operators.append((self.BINARY, token))
+                expect_operand = True
+            elif token == Token.CLOSE_PARENTH or token == Token.COMMA:
+                while operators and operators[-1][0] in (self.NEGATE, self.BINARY):
+                    self.__reduce(operands, operators.pop())
+                if not operators:
+                    break
+                if token == Token.COMMA:
+                    if operators[-1][0] != self.CALL:
+                        raise self.__error("Unexpected ,")
+                    expect_operand = True
+                elif operators[-1][0] == self.CALL:
+                    self.__reduce_call(operands, operators.pop()[1])
                 else:
-                    val = Value(variable, ExpressionType.VALUE)
-
-                self.__add_value(op_stack, val)
-            elif self.__last_token == Token.REF and op_stack.top.type == ExpressionType.PLACEHOLDER:
-                ref = True
-            elif self.OPERATOR_EXPS[self.__last_token] in self.OPERATORS:
-                operator = self.OPERATOR_EXPS[self.__last_token]
-                if op_stack.top.type == ExpressionType.VALUE:
-                    temp = op_stack.top
-                    op_stack.pop()
-                    op_stack.push(Value(self.OPERATOR_STRS[self.__last_token], operator))
-                    op_stack.top.left = temp
-                elif op_stack.top.type == ExpressionType.PLACEHOLDER and operator == ExpressionType.MINUS:
-                    negate = True
-                elif op_stack.top.type == ExpressionType.PLACEHOLDER and operator == ExpressionType.MULTIPLY:
-                    deref = True
-                elif self.OPERATORS[op_stack.top.type] <= self.OPERATORS[operator]:
-                    temp = op_stack.pop()
-                    temp2 = op_stack.top
-                    op_stack.push(Value(self.OPERATOR_STRS[self.__last_token], operator))
-                    if temp2 is not None:
-                        if temp2.left is temp:
-                            temp2.left = op_stack.top
-                        elif temp2.right is temp:
-                            temp2.right = op_stack.top
-                    op_stack.top.left = temp
-                    op_stack.push(temp)
-                elif self.OPERATORS[op_stack.top.type] > self.OPERATORS[operator]:
-                    first_val = op_stack.top.right
-                    op_stack.top.right = None
-                    new_val = Value(self.OPERATOR_STRS[self.__last_token], operator)
-                    op_stack.top.right = new_val
-                    op_stack.push(new_val)
-                    op_stack.top.left = first_val
+                    operators.pop()
+            else:
+                break
             self.__next()
 
-        return op_stack.que[0]
-
-    def __add_value(self, op_stack, val):
-        while len(op_stack.que) > 0:
-            if op_stack.top is None or op_stack.top.type == ExpressionType.PLACEHOLDER:
-                op_stack.top.type = ExpressionType.VALUE
-                if val.type == ExpressionType.REFERENCE or val.type == ExpressionType.DEREFERENCE:
-                    op_stack.top.type = val.type
-                op_stack.top.value = val.value
-                break
-            elif op_stack.top.left is None and op_stack.top.type != ExpressionType.VALUE:
-                op_stack.top.left = val
-                break
-            elif op_stack.top.right is None and op_stack.top.type != ExpressionType.VALUE:
-                op_stack.top.right = val
-                break
+        while operators:
+            if operators[-1][0] not in (self.NEGATE, self.BINARY):
+                raise self.__error("Missing )")
+            self.__reduce(operands, operators.pop())
+        if expect_operand or len(operands) != 1:
+            raise self.__error("Incomplete expression")
+        return operands[0]
+
+    def __reduce(self, operands, operator):
+        kind, token = operator
+        if kind == self.NEGATE:
+            operand = operands.pop()
+            if operand.type == ExpressionType.VALUE and isinstance(operand.value, (int, float)):
+                operand.value = -operand.value
+                operands.append(operand)
             else:
-                op_stack.pop()
+                val = Value("*", ExpressionType.MULTIPLY)
+                val.left = Value(-1, ExpressionType.VALUE)
+                val.right = operand
+                operands.append(val)
+            return
+        val = Value(self.OPERATOR_STRS[token], self.OPERATOR_EXPS[token])
+        val.right = operands.pop()
+        val.left = operands.pop()
+        operands.append(val)
+
+    @staticmethod
+    def __reduce_call(operands, call):
+        name, first = call
+        args = operands[first:]
+        del operands[first:]
+        operands.append(Value(FunctionCall(name, args), ExpressionType.VALUE))
 
     def __funInScope(self, identifier):
-        for s in self.__scope_stack:
-            for fun in s.functions:
-                if fun.name == identifier:
-                    return True
-        return False
+        return self.__symbols.function(identifier) is not None
 
     def __varInScope(self, identifier):
-        for s in self.__scope_stack:
-            for var in s.variables:
-                if var.name == identifier:
-                    return True
-        return False
+        return self.__symbols.variable(identifier) is not None
 
     def __getVar(self, identifier):
-        for s in self.__scope_stack:
-            for var in s.variables:
-                if var.name == identifier:
-                    return var
-        return None
+        return self.__symbols.variable(identifier)
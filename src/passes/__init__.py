@@ -0,0 +1,3 @@
+from .fold import fold_constants
+from .types import resolve_types
+from .dead_code import eliminate_dead_code
@@ -0,0 +1,100 @@
+from typing import Iterable, Optional
+
+from src.ast import Scope, Function, FunctionCall, SetVariable, Return, Value, ExpressionType, Extern, Variable
+from src.ast.walk import walk, calls
+
+
+class Eliminated:
+    def __init__(self):
+        self.functions = []
+        self.stores = 0
+        self.unreachable = 0
+
+    def __bool__(self):
+        return bool(self.functions or self.stores or self.unreachable)
+
+    def __repr__(self):
+        return f"Eliminated(functions={self.functions}, stores={self.stores}, unreachable={self.unreachable})"
+
+
+def reachable(root: Scope, roots: Iterable[str]):
+    """
+    Names of the functions the call graph reaches from roots, roots included.
+    """
+    functions = {func.name: func for func in root.functions}
+    seen = set()
+    stack = [name for name in roots if name in functions]
+    while stack:
+        name = stack.pop()
+        if name in seen:
+            continue
+        seen.add(name)
+        stack += [callee for callee in calls(functions[name]) if callee in functions]
+    return seen
+
+
+def reads(node):
+    return {n.name for n in walk(node) if isinstance(n, Variable)}
+
+
+def addressed(commands):
+    return {n.value.name for command in commands for n in walk(command)
+            if isinstance(n, Value) and n.type == ExpressionType.REFERENCE}
+
+
+def has_call(node):
+    return any(isinstance(n, FunctionCall) for n in walk(node))
+
+
+def eliminate_stores(func: Function):
+    """
+    Drop everything after the first return and then assignments to variables that are
+    never read afterwards. Variables whose address is taken are left alone, as are
+    values containing calls. Returns how many stores and how many unreachable commands
+    were removed.
+    """
+    unreachable = 0
+    for i, command in enumerate(func.commands):
+        if isinstance(command, Return):
+            unreachable = len(func.commands) - i - 1
+            del func.commands[i + 1:]
+            break
+    before = len(func.commands)
+    # Removing a store can drop the last reference to another variable, so repeat until nothing changes
+    while True:
+        escaped = addressed(func.commands) | {name for nested in func.functions for name in reads(nested)}
+        live = set()
+        kept = []
+        for command in reversed(func.commands):
+            if isinstance(command, SetVariable) and not command.deref:
+                if command.name not in live and command.name not in escaped and not has_call(command.value):
+                    continue
+                live.discard(command.name)
+            elif isinstance(command, SetVariable):
+                live.add(command.name)
+            live |= reads(command)
+            kept.append(command)
+        if len(kept) == len(func.commands):
+            break
+        func.commands = kept[::-1]
+    # Only stores are ever dropped by the loop above
+    return before - len(func.commands), unreachable
+
+
+def eliminate_dead_code(root: Scope, roots: Optional[Iterable[str]] = None):
+    """
+    Remove the functions not reachable from roots (no function is removed if roots is
+    None) and dead stores in the ones that are left. Must run after the type pass so
+    variable types do not depend on assignments that are removed.
+    """
+    eliminated = Eliminated()
+    if roots is not None:
+        externs = {command.identifier for command in root.commands if isinstance(command, Extern)}
+        keep = reachable(root, roots) | externs
+        eliminated.functions = [func.name for func in root.functions if func.name not in keep]
+        root.functions = [func for func in root.functions if func.name in keep]
+    for func in root.functions:
+        stores, unreachable = eliminate_stores(func)
+        eliminated.stores += stores
+        eliminated.unreachable += unreachable
+    return eliminated
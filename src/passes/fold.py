@@ -0,0 +1,171 @@
+from src.ast import Scope, Function, FunctionCall, SetVariable, Return, Value, ExpressionType, Types, Variable, count
+
+INT_MIN = -2 ** 31
+NUMERIC = {Types.INT, Types.FLOAT}
+ARITHMETIC = {ExpressionType.ADD, ExpressionType.MINUS, ExpressionType.MULTIPLY, ExpressionType.DIVIDE,
+              ExpressionType.NEGATE}
+
+
+def wrap(v: int):
+    # Integer literals are i32, fold with the same wrap around the generated code has
+    return (v - INT_MIN) % 2 ** 32 + INT_MIN
+
+
+def constant(value: Value):
+    if value.type == ExpressionType.VALUE and isinstance(value.value, (int, float)) \
+            and not isinstance(value.value, bool):
+        return value.value
+    return None
+
+
+def is_int(value: Value, literal: int):
+    c = constant(value)
+    return isinstance(c, int) and c == literal
+
+
+def numeric(value: Value):
+    """
+    Whether value is known to be an int or a double. Arithmetic always is, while a
+    variable without a declared type or a call is only known after the type pass.
+    """
+    if value.value_type is not None:
+        return value.value_type in NUMERIC
+    if value.type in ARITHMETIC or constant(value) is not None:
+        return True
+    return value.type == ExpressionType.VALUE and isinstance(value.value, Variable) and value.value.type in NUMERIC
+
+
+def negate(value: Value):
+    c = constant(value)
+    if c is not None:
+        return Value(wrap(-c) if isinstance(c, int) else -c, ExpressionType.VALUE)
+    if value.type == ExpressionType.NEGATE:
+        return value.left
+    node = Value("-", ExpressionType.NEGATE)
+    node.left = value
+    return node
+
+
+def evaluate(op: ExpressionType, a, b):
+    if isinstance(a, int) and isinstance(b, int):
+        if op == ExpressionType.ADD:
+            return wrap(a + b)
+        elif op == ExpressionType.MINUS:
+            return wrap(a - b)
+        elif op == ExpressionType.MULTIPLY:
+            return wrap(a * b)
+        # sdiv truncates towards zero and is undefined for a zero divisor and INT_MIN / -1
+        elif b == 0 or (a == INT_MIN and b == -1):
+            return None
+        quotient = abs(a) // abs(b)
+        return quotient if (a < 0) == (b < 0) else -quotient
+    a, b = float(a), float(b)
+    if op == ExpressionType.ADD:
+        return a + b
+    elif op == ExpressionType.MINUS:
+        return a - b
+    elif op == ExpressionType.MULTIPLY:
+        return a * b
+    return a / b if b != 0.0 else None
+
+
+def simplify(node: Value):
+    """
+    Fold a binary or negation node whose operands are already simplified. Identities
+    only drop the operation when the operand left over is numeric, b * 1 is an int
+    for a bool b but b alone is not. Like -ffast-math's no-signed-zeros, x + 0 is x
+    even for a double x of -0.0.
+    """
+    left, right = node.left, node.right
+    if node.type == ExpressionType.NEGATE:
+        return negate(left)
+
+    a, b = constant(left), constant(right)
+    if a is not None and b is not None and (result := evaluate(node.type, a, b)) is not None:
+        return Value(result, ExpressionType.VALUE)
+
+    if node.type == ExpressionType.ADD:
+        if is_int(right, 0) and numeric(left):
+            return left
+        if is_int(left, 0) and numeric(right):
+            return right
+        if right.type == ExpressionType.NEGATE:
+            node.type, node.value, node.right = ExpressionType.MINUS, "-", right.left
+    elif node.type == ExpressionType.MINUS:
+        if is_int(right, 0) and numeric(left):
+            return left
+        if is_int(left, 0):
+            return negate(right)
+        if right.type == ExpressionType.NEGATE:
+            node.type, node.value, node.right = ExpressionType.ADD, "+", right.left
+    elif node.type == ExpressionType.MULTIPLY:
+        if is_int(right, 1) and numeric(left):
+            return left
+        if is_int(left, 1) and numeric(right):
+            return right
+        if is_int(right, -1):
+            return negate(left)
+        if is_int(left, -1):
+            return negate(right)
+        if left.type == right.type == ExpressionType.NEGATE:
+            node.left, node.right = left.left, right.left
+    elif node.type == ExpressionType.DIVIDE:
+        if is_int(right, 1) and numeric(left):
+            return left
+        if is_int(right, -1):
+            return negate(left)
+    return node
+
+
+def fold_value(value):
+    """
+    Simplify an expression bottom up without recursion and return its new root.
+    Call arguments are folded in place.
+    """
+    results = []
+    stack = [(value, False)]
+    while stack:
+        node, expanded = stack.pop()
+        if isinstance(node, FunctionCall):
+            if not expanded:
+                stack.append((node, True))
+                stack += [(arg, False) for arg in reversed(node.args)]
+                continue
+            if node.args:
+                node.args = results[len(results) - len(node.args):]
+                del results[len(results) - len(node.args):]
+            results.append(node)
+        elif node.type in (ExpressionType.VALUE, ExpressionType.REFERENCE, ExpressionType.DEREFERENCE):
+            if isinstance(node.value, FunctionCall):
+                if not expanded:
+                    stack += [(node, True), (node.value, False)]
+                    continue
+                results.pop()
+            results.append(node)
+        elif not expanded:
+            stack.append((node, True))
+            stack += [(child, False) for child in (node.right, node.left) if child is not None]
+        else:
+            if node.right is not None:
+                node.right = results.pop()
+            node.left = results.pop()
+            results.append(simplify(node))
+    return results[0]
+
+
+def fold_constants(root: Scope):
+    """
+    Fold constants, drop identities and canonicalize negation in every expression
+    below root. Returns how many nodes were removed from the tree.
+    """
+    before = count(root)
+    scopes = [root]
+    while scopes:
+        scope = scopes.pop()
+        scopes += scope.functions
+        for command in scope.commands:
+            if isinstance(command, (SetVariable, Return)):
+                command.value = fold_value(command.value)
+            elif isinstance(command, FunctionCall):
+                fold_value(command)
+    return before - count(root)
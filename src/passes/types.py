@@ -0,0 +1,140 @@
+from typing import Dict
+
+from src.ast import Scope, Function, FunctionCall, SetVariable, Return, Value, ExpressionType, Types, Variable
+
+SCALARS = {Types.INT, Types.FLOAT, Types.BOOL}
+LEAVES = {ExpressionType.VALUE, ExpressionType.REFERENCE, ExpressionType.DEREFERENCE}
+
+
+def ret_type(func: Function):
+    # Functions without a declared return type return an int
+    return Types.INT if func.ret is None else func.ret
+
+
+def arithmetic(left: Types, right: Types):
+    if left not in SCALARS or right not in SCALARS:
+        raise Exception(f"Arithmetic on {left} and {right} is not supported")
+    # Implicit promotion: bool -> int -> double
+    return Types.FLOAT if Types.FLOAT in (left, right) else Types.INT
+
+
+def convertible(source: Types, target: Types):
+    return source == target or (source in SCALARS and target in SCALARS)
+
+
+class TypeResolver:
+    """
+    Annotates every expression node with the type it evaluates to (value_type),
+    every assignment with the type it stores and every return with the type the
+    function returns, and gives variables declared without a type the type of
+    their first assignment. Each node is visited exactly once.
+    """
+
+    def __init__(self, root: Scope):
+        self.root = root
+        self.signatures: Dict[str, Function] = {}
+        scopes = [root]
+        while scopes:
+            scope = scopes.pop()
+            scopes += scope.functions
+            for func in scope.functions:
+                self.signatures.setdefault(func.name, func)
+
+    def resolve(self):
+        self.resolve_scope(self.root, {}, None)
+
+    def resolve_scope(self, scope: Scope, outer: Dict[str, Variable], func):
+        variables = dict(outer)
+        variables.update((variable.name, variable) for variable in scope.variables)
+        for command in scope.commands:
+            if isinstance(command, SetVariable):
+                self.resolve_assignment(command, variables[command.name])
+            elif isinstance(command, Return):
+                if func is None:
+                    raise Exception("return outside of a function")
+                ty = self.resolve_value(command.value)
+                command.value_type = ret_type(func)
+                if not convertible(ty, command.value_type):
+                    raise Exception(f"{func.name} returns {command.value_type}, not {ty}")
+            elif isinstance(command, FunctionCall):
+                self.resolve_value(command)
+        for nested in scope.functions:
+            self.resolve_scope(nested, variables, nested)
+
+    def resolve_assignment(self, command: SetVariable, variable: Variable):
+        ty = self.resolve_value(command.value)
+        if command.deref:
+            if variable.type != Types.POINTER:
+                raise Exception(f"Cannot store through {variable.name}, it is not a pointer")
+            target = variable.pointee
+        else:
+            if variable.type is None:
+                variable.type = ty
+                if ty == Types.POINTER:
+                    variable.pointee = self.pointee(command.value)
+            target = variable.type
+        if not convertible(ty, target):
+            raise Exception(f"Cannot assign {ty} to {variable.name} of type {target}")
+        command.value_type = target
+
+    @staticmethod
+    def pointee(value: Value):
+        if value.type == ExpressionType.REFERENCE:
+            return value.value.type
+        elif value.type == ExpressionType.VALUE and isinstance(value.value, Variable):
+            return value.value.pointee
+        raise Exception("Pointer arithmetic is not supported")
+
+    def resolve_value(self, value):
+        """
+        Post-order over the expression with an explicit stack, children are typed
+        before their parent reads them.
+        """
+        stack = [(value, False)]
+        while stack:
+            node, expanded = stack.pop()
+            if isinstance(node, FunctionCall):
+                if not expanded:
+                    stack.append((node, True))
+                    stack += [(arg, False) for arg in node.args]
+                    continue
+                self.check_call(node)
+            elif node.type in LEAVES:
+                v = node.value
+                if isinstance(v, FunctionCall):
+                    if not expanded:
+                        stack += [(node, True), (v, False)]
+                        continue
+                    node.value_type = ret_type(self.signatures[v.name])
+                elif node.type == ExpressionType.REFERENCE:
+                    node.value_type = Types.POINTER
+                elif node.type == ExpressionType.DEREFERENCE:
+                    if v.type != Types.POINTER:
+                        raise Exception(f"Cannot dereference {v.name}, it is not a pointer")
+                    node.value_type = v.pointee
+                elif isinstance(v, Variable):
+                    node.value_type = v.type
+                elif isinstance(v, float):
+                    node.value_type = Types.FLOAT
+                else:
+                    node.value_type = Types.INT
+            elif not expanded:
+                stack.append((node, True))
+                stack += [(child, False) for child in (node.left, node.right) if child is not None]
+            elif node.type == ExpressionType.NEGATE:
+                node.value_type = arithmetic(node.left.value_type, Types.INT)
+            else:
+                node.value_type = arithmetic(node.left.value_type, node.right.value_type)
+        return value.value_type if isinstance(value, Value) else ret_type(self.signatures[value.name])
+
+    def check_call(self, call: FunctionCall):
+        func = self.signatures[call.name]
+        if len(call.args) != len(func.args):
+            raise Exception(f"{call.name} takes {len(func.args)} arguments, got {len(call.args)}")
+        for arg, param in zip(call.args, func.args):
+            if not convertible(arg.value_type, param.type):
+                raise Exception(f"Argument {param.name} of {call.name} is {param.type}, not {arg.value_type}")
+
+
+def resolve_types(root: Scope):
+    TypeResolver(root).resolve()
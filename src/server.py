@@ -0,0 +1,174 @@
+"""
+A long running compile server that keeps llvmlite, the LLVM targets and compiled
+modules warm. See src/client.py for the protocol and the client.
+"""
+import argparse
+import asyncio
+import hashlib
+import json
+import os
+import sys
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from typing import Optional
+
+from src.client import HEADER, MAX_FRAME, encode
+from src.lexer import Lexer
+from src.parser import Parser
+from src.compile.artifact import encode_signature
+from src.compile.compiler import Compiler
+from src.compile.session import JitSession, initialize
+
+
+def module_key(source: str, opt_level: int):
+    return hashlib.sha256(f"{opt_level}\0{source}".encode("utf-8")).hexdigest()
+
+
+async def read_frame(reader: asyncio.StreamReader):
+    try:
+        length, = HEADER.unpack(await reader.readexactly(HEADER.size))
+    except asyncio.IncompleteReadError:
+        return None
+    if length > MAX_FRAME:
+        raise Exception(f"Frame of {length} bytes is larger than {MAX_FRAME}")
+    return json.loads(await reader.readexactly(length))
+
+
+class CompileServer:
+    """
+    Serves compile, run and call requests from any number of clients. Compilation and
+    native calls run on a pool of worker threads, compiled programs are kept in an LRU
+    cache of at most max_modules sessions keyed on their source and optimization level.
+    """
+
+    def __init__(self, path: str, workers: Optional[int] = None, max_modules: int = 64):
+        # Pay for the target initialization once, before the first client
+        initialize()
+        self.path = path
+        self.max_modules = max_modules
+        self.modules = OrderedDict()
+        self.requests = 0
+        self.hits = 0
+        self.misses = 0
+        self.__pool = ThreadPoolExecutor(workers)
+        self.__server = None
+        self.__stopped = None
+
+    async def serve(self):
+        if os.path.exists(self.path):
+            os.remove(self.path)
+        self.__stopped = asyncio.Event()
+        self.__server = await asyncio.start_unix_server(self.__connection, path=self.path)
+        try:
+            await self.__stopped.wait()
+        finally:
+            self.__server.close()
+            await self.__server.wait_closed()
+            self.__pool.shutdown(wait=False)
+            if os.path.exists(self.path):
+                os.remove(self.path)
+
+    def stop(self):
+        if self.__stopped is not None:
+            self.__stopped.set()
+
+    async def __connection(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter):
+        try:
+            while (request := await read_frame(reader)) is not None:
+                response = await self.handle(request)
+                writer.write(encode(response))
+                await writer.drain()
+                if request.get("op") == "shutdown":
+                    self.stop()
+        except (ConnectionError, asyncio.IncompleteReadError):
+            pass
+        finally:
+            writer.close()
+
+    async def handle(self, request: dict):
+        self.requests += 1
+        response = {"id": request.get("id")}
+        try:
+            op = request.get("op")
+            if op == "compile":
+                key, session = await self.__compile(request)
+                functions = [encode_signature(func) for func in session.signatures.values()]
+                response.update(module=key, functions=functions)
+            elif op == "run":
+                key, session = await self.__module(request)
+                response.update(module=key, result=await self.__call(session, request.get("function", "main"),
+                                                                     request.get("args", [])))
+            elif op == "call":
+                key, session = await self.__module(request)
+                if "calls" in request:
+                    response["results"] = await asyncio.get_running_loop().run_in_executor(
+                        self.__pool, session.call_many, request["function"], [tuple(c) for c in request["calls"]])
+                else:
+                    response["result"] = await self.__call(session, request["function"], request.get("args", []))
+            elif op == "stats":
+                response.update(modules=len(self.modules), requests=self.requests, hits=self.hits,
+                                misses=self.misses)
+            elif op not in ("ping", "shutdown"):
+                raise Exception(f"Unknown op {op!r}")
+            response["ok"] = True
+        except Exception as e:
+            response.update(ok=False, error=str(e) or type(e).__name__)
+        return response
+
+    async def __call(self, session, function: str, args):
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(self.__pool, lambda: session.function(function)(*args))
+
+    async def __module(self, request: dict):
+        if "source" in request:
+            return await self.__compile(request)
+        key = request.get("module")
+        if key not in self.modules:
+            raise Exception(f"Unknown module {key}, compile it first")
+        self.modules.move_to_end(key)
+        return key, await self.modules[key]
+
+    async def __compile(self, request: dict):
+        source = request["source"]
+        opt_level = request.get("opt_level", 0)
+        key = module_key(source, opt_level)
+        if key in self.modules:
+            self.hits += 1
+            self.modules.move_to_end(key)
+            return key, await self.modules[key]
+        # Concurrent requests for the same program wait on the one compilation
+        future = self.modules[key] = asyncio.get_running_loop().run_in_executor(
+            self.__pool, self.__build, request.get("name") or "module", source, opt_level)
+        try:
+            session = await future
+        except Exception:
+            self.modules.pop(key, None)
+            raise
+        # Only programs that compiled count as misses, broken ones are never cached
+        self.misses += 1
+        while len(self.modules) > self.max_modules:
+            self.modules.popitem(last=False)
+        return key, session
+
+    def __build(self, name: str, source: str, opt_level: int):
+        session = JitSession(opt_level)
+        session.add(Compiler(name, Parser(Lexer(source)), opt_level))
+        return session
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(prog="ezscript-server", description="Run the ezscript compile server")
+    parser.add_argument("socket", help="path of the Unix domain socket to listen on")
+    parser.add_argument("-j", "--workers", type=int, help="worker threads")
+    parser.add_argument("--max-modules", type=int, default=64, help="compiled programs to keep in memory")
+    args = parser.parse_args(argv)
+    server = CompileServer(args.socket, args.workers, args.max_modules)
+    try:
+        asyncio.run(server.serve())
+    except KeyboardInterrupt:
+        pass
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
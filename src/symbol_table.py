@@ -0,0 +1,68 @@
+class SymbolTable:
+    """
+    Scope chain for the parser. Every name maps to a stack of bindings ordered by
+    scope depth, so a lookup only looks at the innermost binding no matter how
+    deep the scope chain is or how many symbols each scope holds.
+    """
+
+    def __init__(self):
+        self.__functions = {}
+        self.__variables = {}
+        self.__frames = []
+
+    def push(self, scope):
+        self.__frames.append((scope, [], []))
+        scope.symbols = self
+        for function in scope.functions:
+            self.add_function(function, scope)
+        for variable in scope.variables:
+            self.add_variable(variable, scope)
+
+    def pop(self):
+        scope, functions, variables = self.__frames.pop()
+        self.__unbind(self.__functions, functions)
+        self.__unbind(self.__variables, variables)
+        scope.symbols = None
+        return scope
+
+    def add_function(self, function, scope=None):
+        self.__bind(self.__functions, 1, function.name, function, scope)
+
+    def add_variable(self, variable, scope=None):
+        self.__bind(self.__variables, 2, variable.name, variable, scope)
+
+    def function(self, name):
+        bindings = self.__functions.get(name)
+        return bindings[-1][1] if bindings else None
+
+    def variable(self, name):
+        bindings = self.__variables.get(name)
+        return bindings[-1][1] if bindings else None
+
+    def __len__(self):
+        return len(self.__frames)
+
+    def __depth(self, scope):
+        if scope is None:
+            return len(self.__frames) - 1
+        for depth in range(len(self.__frames) - 1, -1, -1):
+            if self.__frames[depth][0] is scope:
+                return depth
+        raise Exception("Scope is not on the symbol table")
+
+    def __bind(self, table, slot, name, symbol, scope):
+        depth = self.__depth(scope)
+        bindings = table.setdefault(name, [])
+        i = len(bindings)
+        while i > 0 and bindings[i - 1][0] > depth:
+            i -= 1
+        bindings.insert(i, (depth, symbol))
+        self.__frames[depth][slot].append(name)
+
+    @staticmethod
+    def __unbind(table, names):
+        for name in names:
+            bindings = table[name]
+            bindings.pop()
+            if not bindings:
+                del table[name]
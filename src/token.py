@@ -20,3 +20,4 @@ class Token(Enum):
     EQUALS = -16
     COLON = -17
     REF = -18
+    IMPORT = -19
@@ -1,6 +1,12 @@
 from unittest import main
 from test.lexer_test import *
+from test.parser_test import *
 from test.compiled_test import *
+from test.instrument_test import *
+from test.passes_test import *
+from test.interpreter_test import *
+from test.server_test import *
+from test.cli_test import *
 
 if __name__ == "__main__":
     main()
@@ -0,0 +1,49 @@
+import io
+import os
+import subprocess
+import sys
+import tempfile
+import unittest
+from contextlib import redirect_stderr, redirect_stdout
+
+from src.cli import main
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+def ezscript(*argv):
+    out, err = io.StringIO(), io.StringIO()
+    with redirect_stdout(out), redirect_stderr(err):
+        status = main(argv)
+    return status, out.getvalue(), err.getvalue()
+
+
+class CliCases(unittest.TestCase):
+    def test_front_end_skips_llvm(self):
+        script = ("import sys\nfrom src.cli import main\n"
+                  "main(['check', 'test_file.ez'])\nmain(['ast', '--passes', 'test_file.ez'])\n"
+                  "print('llvmlite' in sys.modules)\n")
+        output = subprocess.run([sys.executable, "-c", script], cwd=ROOT, capture_output=True, text=True, check=True)
+        self.assertEqual(output.stdout.splitlines()[-1], "False")
+
+    def test_commands(self):
+        self.assertEqual(ezscript("check", "../test_file.ez"), (0, "../test_file.ez: ok\n", ""))
+        status, out, _ = ezscript("ast", "../test_file.ez")
+        self.assertIn("Function absolute(x: int): int", out)
+        self.assertIn("define i32 @main()", ezscript("ir", "-O1", "../test_file.ez")[1])
+        self.assertEqual(ezscript("run", "../test_file.ez"), (0, "4\n", ""))
+        self.assertEqual(ezscript("run", "--interpret", "--threshold", "1", "../test_file.ez")[1], "4\n")
+        with tempfile.TemporaryDirectory() as directory:
+            broken = os.path.join(directory, "broken.ez")
+            with open(broken, "w") as f:
+                f.write("fun broken(: int\n")
+            status, out, err = ezscript("check", "../test_file.ez", broken)
+            self.assertEqual((status, out), (1, "../test_file.ez: ok\n"))
+            self.assertTrue(err.startswith(broken))
+            artifact = os.path.join(directory, "test_file.ezbc")
+            self.assertEqual(ezscript("build", "../test_file.ez", "-o", artifact)[:2], (0, artifact + "\n"))
+            self.assertEqual(ezscript("run", artifact)[1], "4\n")
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -1,19 +1,246 @@
+import array
+import os
+import tempfile
 import unittest
 
 from src import Lexer, Parser
-from src.compile import Compiler
+from src.compile import Compiler, ObjectCache, JitSession
 from src.compile.runner import run
+from src.compile.aot import build_shared, load_shared
+from src.compile.build import build, compile_file, discover
+from src.compile.incremental import IncrementalBuilder
+from src.compile import vectorize
+from src.compile.session import prototype
+from src.compile.externs import symbols
+from src.compile.parallel import parallel_map, parallel_reduce
+from src.compile.lazy import LazyJit
+from src.compile.artifact import Artifact
+from src.ast import Function, Types, Variable
 
 
 class CompileCases(unittest.TestCase):
     def test_compile(self):
-        raw_str = ""
-        with open("../test_file.ez") as f:
-            raw_str = f.read()
-        parser = Parser(Lexer(raw_str))
+        parser = Parser(Lexer.open("../test_file.ez"))
         compiler = Compiler("test_file", parser)
         run(compiler)
 
+    def test_compile_optimized(self):
+        with open("../test_file.ez") as f:
+            raw_str = f.read()
+        compiler = Compiler("test_file", Parser(Lexer(raw_str)), opt_level=2)
+        with tempfile.TemporaryDirectory() as directory:
+            run(compiler, dump_ir=directory)
+            with open(os.path.join(directory, "test_file.O0.ll")) as f:
+                self.assertIn("alloca", f.read())
+            with open(os.path.join(directory, "test_file.O2.ll")) as f:
+                self.assertNotIn("alloca", f.read())
+
+    def test_object_cache(self):
+        with open("../test_file.ez") as f:
+            raw_str = f.read()
+        with tempfile.TemporaryDirectory() as directory:
+            cache = ObjectCache(directory)
+            run(Compiler("test_file", Parser(Lexer(raw_str))), cache=cache)
+            run(Compiler("test_file", Parser(Lexer(raw_str))), cache=cache)
+            run(Compiler("test_file", Parser(Lexer(raw_str)), opt_level=1), cache=cache)
+            stats = cache.stats()
+            self.assertEqual((stats["hits"], stats["misses"], stats["entries"]), (1, 2, 2))
+            cache.max_size = stats["size"] - 1
+            self.assertEqual(cache.evict(), 1)
+
+    def test_object_cache_key(self):
+        source = "extern abs(a: int): int\nfun f(x: int): int\n    return abs(x)\nend\nfun main(): int\n    return f(0-3)\nend\n"
+        with tempfile.TemporaryDirectory() as directory:
+            cache = ObjectCache(directory)
+            run(Compiler("key", Parser(Lexer(source))), cache=cache)
+            run(Compiler("key", Parser(Lexer(source)), fold=False), cache=cache)
+            run(Compiler("key", Parser(Lexer(source)), roots=["main"]), cache=cache)
+            parser = Parser(Lexer(source))
+            parser.parse()
+            # A tree without a source hash must not collide with anything, it skips the cache
+            run(Compiler("key", parser.getTree()), cache=cache)
+            stats = cache.stats()
+            self.assertEqual((stats["hits"], stats["misses"], stats["entries"]), (0, 3, 3))
+        # Same source, but the imported function changed its signature
+        program = "import lib\nfun main(): int\n    return triple(2)\nend\n"
+        before = Compiler("key", Parser(Lexer(program), lambda name: [Function("triple", [Variable("x", Types.INT)])]))
+        after = Compiler("key", Parser(Lexer(program), lambda name: [Function("triple", [Variable("x", Types.FLOAT)])]))
+        self.assertEqual(before.source_hash, after.source_hash)
+        self.assertNotEqual(before.fingerprint(), after.fingerprint())
+
+    def test_session_links_modules(self):
+        session = JitSession()
+        session.add(Compiler("lib", Parser(Lexer("fun triple(x: int): int\n    return x*3\nend\n"))))
+        session.add(Compiler("app", Parser(Lexer("extern triple(x: int): int\n"
+                                                 "fun twice(x: int): int\n    return triple(x)+triple(x)\nend\n"))))
+        self.assertEqual(session.function("triple")(5), 15)
+        self.assertEqual(session.function("twice")(-2), -12)
+        with self.assertRaises(Exception):
+            session.add(Compiler("again", Parser(Lexer("fun triple(x: int): int\n    return x\nend\n"))))
+
+    def test_aot_shared_library(self):
+        with open("../test_file.ez") as f:
+            compiler = Compiler("test_file", Parser(Lexer(f.read())), opt_level=2)
+        with tempfile.TemporaryDirectory() as directory:
+            library = load_shared(build_shared(compiler, os.path.join(directory, "libtest_file.so")))
+            self.assertEqual(library.absolute(-7), 14)
+            self.assertEqual(library.main(), 4)
+
+    def test_parallel_build(self):
+        sources = {
+            "main.ez": "import util\nimport math\nfun main(): int\n    a = 5\n    return square(a)+twice(a)\nend\n",
+            "util.ez": "import math\nfun twice(x: int): int\n    return square(x)/x*2\nend\n",
+            "math.ez": "fun square(x: int): int\n    return x*x\nend\n",
+        }
+        with tempfile.TemporaryDirectory() as directory:
+            for name, text in sources.items():
+                with open(os.path.join(directory, name), "w") as f:
+                    f.write(text)
+            result = build([os.path.join(directory, "main.ez")], opt_level=2, jobs=2)
+            declarations = {}
+            files = discover([os.path.join(directory, "main.ez")], declarations=declarations)
+            self.assertEqual(sorted(declarations), sorted(files))
+            # Imports come from the scanned declarations, math.ez is not parsed again
+            with open(files[2], "w") as f:
+                f.write("fun broken(: int\n")
+            self.assertEqual([func.name for func in compile_file(files[1], 0, (), declarations)[1]], ["twice"])
+        self.assertEqual([os.path.basename(f) for f in result.files], ["main.ez", "util.ez", "math.ez"])
+        session = JitSession()
+        session.add_module(result.module, result.signatures)
+        self.assertEqual(session.function("main")(), 35)
+
+    def test_incremental_build(self):
+        def program(square, twice="twice(x: int): int"):
+            return (f"fun square(x: int): int\n    return {square}\nend\n"
+                    f"fun {twice}\n    return x+x\nend\n"
+                    "fun main(): int\n    a = 3\n    return square(a)\nend\n")
+
+        with tempfile.TemporaryDirectory() as directory:
+            builder = IncrementalBuilder(directory=directory)
+            result = builder.build(Compiler("inc", Parser(Lexer(program("x*x")))))
+            self.assertEqual(result.rebuilt, ["square", "twice", "main"])
+            result = builder.build(Compiler("inc", Parser(Lexer(program("x*x")))))
+            self.assertEqual(result.rebuilt, [])
+            result = builder.build(Compiler("inc", Parser(Lexer(program("x*x*x")))))
+            self.assertEqual(result.rebuilt, ["square"])
+            builder = IncrementalBuilder(directory=directory)
+            result = builder.build(Compiler("inc", Parser(Lexer(program("x*x*x", "twice(x: double): double")))))
+            self.assertEqual(result.rebuilt, ["twice"])
+        session = JitSession()
+        session.add_module(result.module, result.signatures)
+        self.assertEqual(session.function("main")(), 27)
+
+    def test_vectorize(self):
+        session = JitSession(opt_level=2)
+        session.add(Compiler("kernel", Parser(Lexer("fun f(x: double, n: int): double\n    return x*x+n\nend\n"))))
+        f = session.vectorize("f")
+        self.assertIs(session.vectorize("f"), f)
+        out = array.array("d", [0.0] * 3)
+        f(array.array("d", [1.0, 2.0, 3.0]), array.array("i", [1, 0, -1]), out=out)
+        self.assertEqual(list(out), [2.0, 4.0, 8.0])
+        with self.assertRaises(Exception):
+            f(array.array("d", [1.0]), array.array("i", [1, 2]))
+        if vectorize.numpy is not None:
+            numpy = vectorize.numpy
+            x = numpy.linspace(0, 1, 1000)
+            self.assertTrue(numpy.allclose(f(x, numpy.ones(1000, "int32")), x * x + 1))
+            # Safe casts and exact conversions are fine, anything that changes a value is not
+            self.assertEqual(list(f(numpy.arange(3, dtype="int32"), numpy.ones(3, bool))), [1.0, 2.0, 5.0])
+            self.assertEqual(list(f([1, 2], [3, -4])), [4.0, 0.0])
+            for n in (numpy.ones(2), numpy.ones(2, "int64"), [1, 2.5], [2 ** 40, 1]):
+                with self.assertRaises(Exception):
+                    f([1.0, 2.0], n)
+
+    def test_typed_callables(self):
+        session = JitSession()
+        session.add(Compiler("calls", Parser(Lexer(
+            "fun add(a: int, b: int): int\n    return a+b\nend\n"
+            "fun scale(x: double, n: int): double\n    return x*n\nend\n"
+            "fun seven()\n    return 7\nend\n"))))
+        functions = session.functions()
+        self.assertEqual(set(functions), {"add", "scale", "seven"})
+        self.assertIs(session.function("add"), functions["add"])
+        self.assertIs(prototype(Types.INT, Types.INT, Types.INT), prototype(Types.INT, Types.INT, Types.INT))
+        self.assertEqual(functions["scale"](1.5, 3), 4.5)
+        self.assertEqual(session.call_many("add", [(1, 2), (-5, 5), (2147483647, 1)]), [3, 0, -2147483648])
+        self.assertEqual(session.call_many("scale", ((0.5, n) for n in range(3))), [0.0, 0.5, 1.0])
+        self.assertEqual(session.call_many("seven", [(), ()]), [7, 7])
+
+    def test_native_externs(self):
+        symbols.add_callback("ez_test_offset", lambda x: x + 0.5, Types.FLOAT, [Types.FLOAT])
+        session = JitSession(libraries=["m"])
+        session.add(Compiler("ext", Parser(Lexer(
+            "extern cbrt(x: double): double\nextern ez_test_offset(x: double): double\n"
+            "fun f(x: double): double\n    return ez_test_offset(cbrt(x))\nend\n"))))
+        self.assertAlmostEqual(session.function("f")(27.0), 3.5)
+        self.assertIn("cbrt", symbols.symbols)
+        with self.assertRaises(Exception):
+            session.add(Compiler("missing", Parser(Lexer("extern ez_not_defined(): int\n"))))
+
+    def test_parallel(self):
+        session = JitSession(opt_level=2)
+        session.add(Compiler("par", Parser(Lexer(
+            "fun square(x: int): int\n    return x*x\nend\n"
+            "fun add(a: int, b: int): int\n    return a+b\nend\n"))))
+        out = array.array("i", [0] * 1000)
+        parallel_map(session, "square", array.array("i", range(1000)), out=out, workers=4, chunk_size=64)
+        self.assertEqual(list(out), [x * x for x in range(1000)])
+        self.assertEqual(parallel_reduce(session, "add", range(1000), workers=4, chunk_size=100), 499500)
+        total = parallel_reduce(session, "add", range(1000), map="square", workers=3, chunk_size=77)
+        self.assertEqual(total, sum(x * x for x in range(1000)))
+
+    def test_lazy_jit(self):
+        lazy = LazyJit(Compiler("lazy", Parser(Lexer(
+            "fun square(x: int): int\n    return x*x\nend\n"
+            "fun unused(x: int): int\n    return x\nend\n"
+            "fun twice(x: int): int\n    return square(x)+square(x)\nend\n"
+            "fun main(): int\n    return twice(3)\nend\n")), opt_level=2))
+        main = lazy.function("main")
+        self.assertEqual(lazy.compiled, {})
+        self.assertEqual(main(), 18)
+        self.assertEqual(main(), 18)
+        self.assertEqual(sorted(lazy.compiled), ["main", "square", "twice"])
+        self.assertEqual(lazy.function("square")(-4), 16)
+
+    def test_artifact(self):
+        session = JitSession(opt_level=2)
+        artifact = Artifact.from_compiler(Compiler("art", Parser(Lexer(
+            "fun scale(x: double, n: int): double\n    return x*n\nend\nfun main(): int\n    return 6\nend\n"))), session)
+        with tempfile.TemporaryDirectory() as directory:
+            path = artifact.write(os.path.join(directory, "art.ezbc"))
+            loaded = Artifact.read(path)
+            with open(path, "rb") as f:
+                self.assertEqual(f.read(4), b"EZBC")
+        self.assertEqual((loaded.name, loaded.metadata["opt_level"]), ("art", 2))
+        self.assertEqual([(f.name, [a.type for a in f.args], f.ret) for f in loaded.signatures],
+                         [("scale", [Types.FLOAT, Types.INT], Types.FLOAT), ("main", [], Types.INT)])
+        loaded.load_into(session)
+        self.assertEqual(session.function("scale")(1.5, 4), 6.0)
+        self.assertEqual(session.function("main")(), 6)
+        with self.assertRaises(Exception):
+            Artifact.loads(b"EZBX" + artifact.dumps()[4:])
+
+    def test_artifact_checks(self):
+        session = JitSession()
+        artifact = Artifact.from_compiler(Compiler("portable", Parser(Lexer(
+            "extern abs(a: int): int\nfun g(x: int): int\n    return abs(x)+1\nend\n"))), session, cpu="generic")
+        self.assertEqual((artifact.metadata["cpu"], artifact.metadata["features"]), ("generic", ""))
+        self.assertEqual(artifact.metadata["externs"], ["abs"])
+        for field, value in (("compiler", "0.0.0"), ("triple", "riscv64-unknown-linux-gnu"), ("cpu", "not-a-cpu"),
+                             ("features", "+not-a-feature")):
+            changed = Artifact.loads(artifact.dumps())
+            changed.metadata[field] = value
+            with self.assertRaises(Exception):
+                changed.load_into(session)
+        # An extern nothing provides is reported instead of aborting in MCJIT
+        unresolved = Artifact.from_compiler(Compiler("unresolved", Parser(Lexer(
+            "extern ez_test_nowhere(a: int): int\nfun h(x: int): int\n    return ez_test_nowhere(x)\nend\n"))), session)
+        self.assertEqual(unresolved.metadata["externs"], ["ez_test_nowhere"])
+        with self.assertRaises(Exception):
+            unresolved.load_into(session)
+        Artifact.loads(artifact.dumps()).load_into(session)
+        self.assertEqual(session.function("g")(-3), 4)
+
 
 if __name__ == '__main__':
     unittest.main()
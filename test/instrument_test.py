@@ -0,0 +1,35 @@
+import unittest
+
+from src import Lexer, Parser
+from src.compile import Compiler, JitSession
+from src.instrument import instrumentation
+
+
+class InstrumentCases(unittest.TestCase):
+    def tearDown(self):
+        instrumentation.disable()
+        instrumentation.hooks.clear()
+        instrumentation.reset()
+
+    def test_report_and_hooks(self):
+        events = []
+        instrumentation.enable(lambda phase, seconds, counters: events.append(phase))
+        with open("../test_file.ez") as f:
+            compiler = Compiler("test_file", Parser(Lexer(f.read())))
+        JitSession().add(compiler)
+        report = instrumentation.report()
+        self.assertEqual(events, ["lex", "parse", "fold", "types", "dead_code", "ir", "assemble", "optimize", "finalize"])
+        self.assertGreater(report["lex"]["counters"]["tokens"], 0)
+        self.assertGreater(report["parse"]["counters"]["ast_nodes"], 0)
+        self.assertEqual(report["dead_code"]["counters"], {"functions": 0, "stores": 3, "unreachable": 0})
+        self.assertGreater(report["ir"]["counters"]["instructions"], 0)
+        self.assertGreater(report["finalize"]["counters"]["code_bytes"], 0)
+
+    def test_disabled(self):
+        with open("../test_file.ez") as f:
+            Compiler("test_file", Parser(Lexer(f.read())))
+        self.assertEqual(instrumentation.report(), {})
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,40 @@
+import unittest
+
+from src import Lexer, Parser
+from src.compile import Compiler, JitSession
+from src.interpreter import Interpreter
+
+PROGRAM = ("fun half(x: int): double\n    return x/2.0\nend\n"
+           "fun wrap(x: int): int\n    return x*65536*65536+x/2-(0-7)/2\nend\n"
+           "fun poke(x: int): int\n    p = &x\n    *p = *p+1\n    return x\nend\n"
+           "fun mix(a: double, n: int): int\n    b: double = n\n    return half(n)+a*b\nend\n"
+           "fun nothing(x: int): int\n    x = 1\nend\n")
+
+
+class InterpreterCases(unittest.TestCase):
+    def test_matches_compiled(self):
+        interpreter = Interpreter("interp", Parser(Lexer(PROGRAM)), threshold=None)
+        session = JitSession()
+        session.add(Compiler("interp", Parser(Lexer(PROGRAM))))
+        for name, args in [("half", (3,)), ("wrap", (-9,)), ("poke", (41,)), ("mix", (1.5, 3)), ("nothing", (5,))]:
+            self.assertEqual(interpreter.call(name, *args), session.function(name)(*args), name)
+        self.assertEqual(interpreter.promoted, [])
+        with self.assertRaises(Exception):
+            Interpreter("div", Parser(Lexer("fun f(x: int): int\n    return 1/x\nend\n"))).call("f", 0)
+
+    def test_promotion(self):
+        interpreter = Interpreter("hot", Parser(Lexer(
+            PROGRAM + "fun outer(x: int): int\n    return poke(x)+wrap(x)\nend\n")), threshold=3)
+        results = [interpreter.call("outer", 5) for _ in range(5)]
+        self.assertEqual(set(results), {results[0]})
+        self.assertEqual(interpreter.counters["outer"], 3)
+        self.assertEqual(interpreter.promoted, ["outer", "poke", "wrap"])
+
+    def test_deep_calls(self):
+        source = "fun f0(x: int): int\n    return x\nend\n" + "".join(
+            f"fun f{i}(x: int): int\n    return f{i - 1}(x)+1\nend\n" for i in range(1, 2000))
+        self.assertEqual(Interpreter("deep", Parser(Lexer(source)), threshold=None).call("f1999", 1), 2000)
+
+
+if __name__ == '__main__':
+    unittest.main()
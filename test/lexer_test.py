@@ -1,3 +1,6 @@
+import io
+import mmap
+import tempfile
 import unittest
 from src import Token, Lexer
 from src.parser import Parser
@@ -25,6 +28,37 @@ class MyTestCase(unittest.TestCase):
         self.assertEqual(token, Token.NUMBER)
         self.assertEqual(lexer.lastIdentifier(), "123")
 
+    def test_lexer_positions(self):
+        text = "fun main(): int\n    a = 2*b\nend"
+        lexer = Lexer(text)
+        tokens = []
+        while (token := lexer.nextToken()) != Token.EOF:
+            tokens.append((token, lexer.lastIdentifier(), lexer.lastPosition()))
+        self.assertEqual(tokens[0], (Token.FUN, "fun", (1, 1)))
+        self.assertEqual(tokens[1], (Token.IDENTIFIER, "main", (1, 5)))
+        self.assertEqual(tokens[6], (Token.EOL, "\n", (1, 16)))
+        self.assertEqual(tokens[7], (Token.IDENTIFIER, "a", (2, 5)))
+        self.assertEqual(tokens[9], (Token.NUMBER, "2", (2, 9)))
+        self.assertEqual(tokens[-1], (Token.END, "end", (3, 1)))
+
+    def test_lexer_stream(self):
+        text = "fun main(): int\n    a = 2.5*b\n" + "    a = a+1\n" * 5000 + "end"
+        expected = list(Lexer(text).tokens())
+        with tempfile.TemporaryFile() as f:
+            f.write(text.encode("utf-8"))
+            f.flush()
+            with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as source:
+                sources = [io.StringIO(text), source]
+                for lexer in map(Lexer.open, sources):
+                    lexer.CHUNK_SIZE = 100
+                    self.assertEqual(list(lexer.tokens()), expected)
+                    self.assertEqual(lexer.lastPosition(), (5003, 4))
+                    self.assertEqual(lexer.sourceHash(), Lexer(text).sourceHash())
+        lexer = Lexer.open(io.StringIO(text))
+        lexer.nextToken()
+        with self.assertRaises(Exception):
+            lexer.sourceHash()
+
     # def test_expression(self):
     #     text = """
     #     extern printf
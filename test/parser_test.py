@@ -0,0 +1,83 @@
+import unittest
+
+from src import Lexer, Parser, SymbolTable
+from src.ast import Function, Scope, SetVariable, Variable, Types, ExpressionType
+from src.compile import Compiler, JitSession
+
+
+class ParserCases(unittest.TestCase):
+    def test_symbol_table_scopes(self):
+        symbols = SymbolTable()
+        root = Scope(True)
+        symbols.push(root)
+        root.add_variable(Variable("a", Types.INT))
+        func = Function("f", [Variable("a", Types.FLOAT)])
+        symbols.push(func)
+        self.assertIs(symbols.variable("a"), func.args[0])
+        root.add_function(Function("g"))
+        self.assertIsNotNone(symbols.function("g"))
+        symbols.pop()
+        self.assertEqual(symbols.variable("a").type, Types.INT)
+        self.assertIsNone(symbols.variable("b"))
+
+    def test_parse_scopes(self):
+        text = """extern abs(a: int): int
+
+fun helper(x: int): int
+    y = abs(x)
+    return y
+end
+
+fun main(): int
+    y = 2
+    return helper(y)
+end
+"""
+        parser = Parser(Lexer(text))
+        parser.parse()
+        root = parser.getTree()
+        self.assertEqual([f.name for f in root.functions], ["abs", "helper", "main"])
+        main = root.functions[2]
+        self.assertIsInstance(main.commands[0], SetVariable)
+        self.assertEqual([v.name for v in main.variables], ["y"])
+        self.assertEqual(main.commands[1].value.value.name, "helper")
+
+    def evaluate(self, expression, setup="a = 3\n    b = 5\n"):
+        text = ("fun sub(x: int, y: int): int\n    return x-y\nend\n"
+                f"fun main(): int\n    {setup}    r = {expression}\n    return r\nend\n")
+        session = JitSession()
+        session.add(Compiler("expression", Parser(Lexer(text))))
+        return session.function("main")()
+
+    def test_expressions(self):
+        a, b = 3, 5
+        for expression in ["a+b*2", "(a+b)*2", "a-b-1", "-a*b", "a*-b", "-(a+b)*2", "((a))", "sub(b, a)*2",
+                           "-sub(a, sub(b, 1))+1", "sub(sub(b, a), -(a-b))", "2*(a+b*(b-a))/3"]:
+            expected = eval(expression.replace("sub", "(lambda x, y: x-y)").replace("/", "//"))
+            self.assertEqual(self.evaluate(expression), expected, expression)
+
+    def test_deep_expressions(self):
+        depth = 20000
+        self.assertEqual(self.evaluate("(" * depth + "a" + "+1)" * depth), 3 + depth)
+        self.assertEqual(self.evaluate("a" + "-1" * depth), 3 - depth)
+        self.assertEqual(self.evaluate("sub(" * 2000 + "a" + ", 1)" * 2000), 3 - 2000)
+
+    def test_negated_literal(self):
+        parser = Parser(Lexer("fun main(): int\n    a = -4\n    return a\nend\n"))
+        parser.parse()
+        value = parser.getTree().functions[0].commands[0].value
+        self.assertEqual((value.type, value.value), (ExpressionType.VALUE, -4))
+
+    def test_missing_return_type(self):
+        # The first token after the header is the body's, not a skipped return type
+        parser = Parser(Lexer("extern tick(n: int)\nfun seven()\n    x = 7\n    return x\nend\n"
+                              "fun main(): int\n    return seven()\nend\n"))
+        parser.parse()
+        tick, seven, main = parser.getTree().functions
+        self.assertEqual((tick.ret, seven.ret, main.ret), (None, None, Types.INT))
+        self.assertEqual([type(command).__name__ for command in seven.commands], ["SetVariable", "Return"])
+        self.assertEqual(seven.commands[0].name, "x")
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,95 @@
+import unittest
+
+from src import Lexer, Parser
+from src.ast import ExpressionType, FunctionCall, Types
+from src.compile import Compiler, JitSession
+from src.passes import fold_constants, resolve_types, eliminate_dead_code
+
+
+def parse(body, args="x: int"):
+    parser = Parser(Lexer(f"fun f(a: int): int\n    return a\nend\nfun main({args}): int\n{body}\nend\n"))
+    parser.parse()
+    return parser.getTree()
+
+
+class FoldCases(unittest.TestCase):
+    def test_fold_constants(self):
+        root = parse("    return 2*3+x*1")
+        self.assertEqual(fold_constants(root), 4)
+        value = root.functions[1].commands[0].value
+        self.assertEqual(value.type, ExpressionType.ADD)
+        self.assertEqual((value.left.value, value.right.value.name), (6, "x"))
+
+    def test_canonical_negation(self):
+        root = parse("    y = -x\n    z = 1-(-1*y)\n    w = -(-x)\n    return f(0+y*(7/2))")
+        fold_constants(root)
+        y, z, w, ret = [command.value for command in root.functions[1].commands]
+        self.assertEqual((y.type, y.left.value.name), (ExpressionType.NEGATE, "x"))
+        self.assertEqual((z.type, z.left.value, z.right.value.name), (ExpressionType.ADD, 1, "y"))
+        self.assertEqual((w.type, w.value.name), (ExpressionType.VALUE, "x"))
+        call = ret.value
+        self.assertIsInstance(call, FunctionCall)
+        self.assertEqual((call.args[0].type, call.args[0].right.value), (ExpressionType.MULTIPLY, 3))
+
+    def test_fold_keeps_semantics(self):
+        body = "    y = x*-1\n    return -7/2+y*(2147483647+1)-(0-y)/1+f(-1*x)*(6-3*2)"
+        session = JitSession()
+        session.add(Compiler("folded", Parser(Lexer(
+            f"fun f(a: int): int\n    return a\nend\nfun main(x: int): int\n{body}\nend\n"))))
+        unfolded = JitSession()
+        unfolded.add(Compiler("unfolded", Parser(Lexer(
+            f"fun f(a: int): int\n    return a\nend\nfun main(x: int): int\n{body}\nend\n")), fold=False))
+        for x in (0, 5, -9):
+            self.assertEqual(session.function("main")(x), unfolded.function("main")(x))
+        # b*1 is an int, folding it to b would make y a bool
+        source = "fun g(b: bool): int\n    y = b*1\n    y = y+4\n    return y+0\nend\n"
+        session.add(Compiler("bools", Parser(Lexer(source))))
+        self.assertEqual((session.function("g")(True), session.function("g")(False)), (5, 4))
+
+
+class TypeCases(unittest.TestCase):
+    def test_resolve_types(self):
+        root = parse("    y: double = 1\n    z = y*x+2\n    p = &x\n    return *p+f(z)")
+        resolve_types(root)
+        y, z, p, ret = root.functions[1].commands
+        self.assertEqual((y.value_type, y.value.value_type), (Types.FLOAT, Types.INT))
+        self.assertEqual((z.value_type, z.value.left.value_type), (Types.FLOAT, Types.FLOAT))
+        self.assertEqual((p.value_type, root.functions[1].variables[3].pointee), (Types.POINTER, Types.INT))
+        self.assertEqual((ret.value_type, ret.value.right.value.args[0].value_type), (Types.INT, Types.FLOAT))
+
+    def test_promotion(self):
+        session = JitSession()
+        session.add(Compiler("promote", Parser(Lexer(
+            "fun half(x: int): double\n    return x/2.0\nend\n"
+            "fun main(n: int): int\n    a: double = n\n    b = a*2.5+half(n)\n    return b\nend\n"))))
+        self.assertEqual(session.function("half")(3), 1.5)
+        self.assertEqual(session.function("main")(3), 9)
+
+    def test_type_errors(self):
+        for body in ("    p = &x\n    return p*2", "    return *x", "    return f(x, x)"):
+            with self.assertRaises(Exception):
+                resolve_types(parse(body))
+
+
+class DeadCodeCases(unittest.TestCase):
+    def test_dead_stores(self):
+        root = parse("    a = 2\n    b = 3\n    c = &b\n    d = &a\n    p = &x\n    *p = a\n    a = f(1)\n"
+                     "    return x\n    x = 1")
+        eliminated = eliminate_dead_code(root)
+        self.assertEqual((eliminated.functions, eliminated.stores, eliminated.unreachable), ([], 3, 1))
+        commands = root.functions[1].commands
+        self.assertEqual([getattr(c, "name", None) for c in commands], ["a", "p", "p", "a", None])
+
+    def test_unreachable_functions(self):
+        parser = Parser(Lexer("fun g(): int\n    return 1\nend\nfun f(): int\n    return g()\nend\n"
+                              "fun h(): int\n    return 2\nend\nfun main(): int\n    return f()\nend\n"))
+        compiler = Compiler("reach", parser, roots=["main"])
+        self.assertEqual(compiler.eliminated.functions, ["h"])
+        session = JitSession()
+        session.add(compiler)
+        self.assertEqual(session.function("main")(), 1)
+        self.assertEqual(set(session.signatures), {"g", "f", "main"})
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,68 @@
+import asyncio
+import os
+import tempfile
+import threading
+import unittest
+from concurrent.futures import ThreadPoolExecutor
+
+from src.client import Client
+from src.server import CompileServer
+
+PROGRAM = "fun square(x: int): int\n    return x*x\nend\nfun main(): int\n    return square(7)\nend\n"
+
+
+class ServerCases(unittest.TestCase):
+    def start(self, path):
+        server = CompileServer(path, workers=2)
+        ready = threading.Event()
+
+        async def serve():
+            task = asyncio.create_task(server.serve())
+            while not os.path.exists(path):
+                await asyncio.sleep(0.01)
+            ready.set()
+            await task
+
+        thread = threading.Thread(target=asyncio.run, args=(serve(),), daemon=True)
+        thread.start()
+        self.assertTrue(ready.wait(10))
+
+        def stop():
+            try:
+                with Client(path, timeout=10) as client:
+                    client.shutdown()
+            except OSError:
+                pass
+            thread.join(10)
+        self.addCleanup(stop)
+        return thread
+
+    def test_compile_server(self):
+        with tempfile.TemporaryDirectory() as directory:
+            path = os.path.join(directory, "ez.sock")
+            thread = self.start(path)
+            with Client(path, timeout=30) as client:
+                self.assertEqual(client.run(PROGRAM), 49)
+                module = client.compile(PROGRAM)
+                self.assertEqual(client.call(module, "square", -3), 9)
+                self.assertEqual(client.call_many(module, "square", [(1,), (2,), (3,)]), [1, 4, 9])
+                with self.assertRaises(Exception):
+                    client.call(module, "missing")
+                with self.assertRaises(Exception):
+                    client.compile("fun broken(: int\n")
+
+                def run(i):
+                    with Client(path, timeout=30) as other:
+                        return other.run(PROGRAM.replace("7", str(i)))
+                with ThreadPoolExecutor(4) as pool:
+                    self.assertEqual(list(pool.map(run, range(8))), [i * i for i in range(8)])
+                # run(7) is the original program again, the broken one is never a miss
+                stats = client.stats()
+                self.assertEqual((stats["hits"], stats["misses"]), (2, 8))
+                client.shutdown()
+            thread.join(10)
+            self.assertFalse(thread.is_alive())
+
+
+if __name__ == '__main__':
+    unittest.main()